@@ -1,8 +1,20 @@
 import streamlit as st
 import pandas as pd
-import requests
-import time
 import os
+import time
+
+from armazem import INTERVALO_ATUALIZACAO_HORAS, ArmazemResultados, AtualizacaoPeriodica
+from cache_siconfi import CacheRespostas
+from comparacao import comparar, para_tabela_larga
+from dados_ibge import PIB_FILE_PATH, POP_FILE_PATH, assinatura_arquivos, carregar_base_ibge
+from exportacao import (FORMATOS_EXPORTACAO, exportar, novo_arquivo_exportacao, remover_exportacao,
+                        remover_exportacoes_antigas)
+from indicadores import MOTIVO_SEM_DADOS, MemoIndices
+from metricas import METRICAS
+from painel import adicionar_crescimento, atualizar_painel
+from siconfi import ClienteSiconfi
+from visualizacao import (CATEGORIAS, COLUNAS_VISUALIZACAO, LINHAS_POR_PAGINA, filtrar, formatar_pagina,
+                          ordenar, pagina, preparar, total_paginas)
 
 # --- Configurações da Página Streamlit ---
 st.set_page_config(
@@ -18,41 +30,30 @@ if 'siconfi_loaded' not in st.session_state:
     st.session_state.siconfi_loaded = False
 if 'final_table' not in st.session_state:
     st.session_state.final_table = pd.DataFrame()
-if 'pib_data' not in st.session_state:
-    st.session_state.pib_data = pd.DataFrame()
-if 'pop_data' not in st.session_state:
-    st.session_state.pop_data = pd.DataFrame()
-
-# --- Funções para Carregamento de Dados (com cache) ---
-@st.cache_data
-def load_pib_data(file_path):
-    """Carrega e pré-processa os dados de PIB."""
-    try:
-        df_pib = pd.read_excel(file_path)
-        colunas_desejadas = [
-            'Ano', 'Sigla da Unidade da Federação', 'Código do Município', 'Nome do Município',
-            'Produto Interno Bruto, \na preços correntes\n(R$ 1.000)',
-            'Produto Interno Bruto per capita, \na preços correntes\n(R$ 1,00)'
-        ]
-        return df_pib[colunas_desejadas]
-    except FileNotFoundError:
-        st.error(f"Erro: Arquivo '{file_path}' não encontrado. Por favor, verifique o caminho.")
-        return pd.DataFrame()
+if 'resultados' not in st.session_state:
+    st.session_state.resultados = pd.DataFrame()
+if 'exportacao' not in st.session_state:
+    st.session_state.exportacao = None
+if 'painel' not in st.session_state:
+    st.session_state.painel = pd.DataFrame()
+if 'analise_cancelada' not in st.session_state:
+    st.session_state.analise_cancelada = False
 
-@st.cache_data
-def load_pop_data(file_path):
-    """Carrega e pré-processa os dados de População."""
-    try:
-        populacao = pd.read_excel(file_path, header=1, dtype=object)
-        populacao.drop(populacao.tail(35).index, inplace=True)
-        populacao['POPULAÇÃO'] = pd.to_numeric(populacao['POPULAÇÃO'], errors='coerce')
-        populacao['COD. UF'] = populacao['COD. UF'].astype(str)
-        populacao['COD. MUNIC'] = populacao['COD. MUNIC'].astype(str)
-        populacao['cod_ibge'] = populacao['COD. UF'] + populacao['COD. MUNIC']
-        return populacao
-    except FileNotFoundError:
-        st.error(f"Erro: Arquivo '{file_path}' não encontrado. Por favor, verifique o caminho.")
-        return pd.DataFrame()
+# --- Carregamento de Dados (compartilhado entre sessões) ---
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_base_ibge(pib_file_path, pop_file_path, assinatura):
+    """
+    Carrega PIB e População uma única vez por processo. Todas as sessões
+    compartilham os mesmos DataFrames (somente leitura), identificados por
+    `versao`; nada é copiado para o estado da sessão. A `assinatura` (tamanho
+    e data de modificação das planilhas) faz parte da chave, de modo que uma
+    planilha substituída é recarregada e a versão anterior, descartada.
+    """
+    return carregar_base_ibge(pib_file_path, pop_file_path)
+
+
+def base_ibge_atual():
+    return load_base_ibge(PIB_FILE_PATH, POP_FILE_PATH, assinatura_arquivos(PIB_FILE_PATH, POP_FILE_PATH))
 
 # --- Mapeamentos e Dicionários para Análise ---
 ibge_to_nome = {
@@ -62,6 +63,9 @@ ibge_to_nome = {
 nome_to_ibge = {v: k for k, v in ibge_to_nome.items()}
 all_municipios_names = list(ibge_to_nome.values())
 available_years = list(range(2020, 2021))
+available_panel_years = list(range(2015, 2022))
+# Acima deste número de municípios, a tabela comparativa (uma coluna por município) não é exibida
+LIMITE_TABELA_LARGA = 10
 
 interpretacoes = {
     "A1_PIB per Capita": "Renda média por habitante", "A2_Receita Total per Capita": "Arrecadação por habitante",
@@ -113,178 +117,198 @@ formulas = {
 }
 
 
-# --- Função Principal para Calcular Índices (com cache) ---
-@st.cache_data(show_spinner="Buscando dados no SICONFI e calculando índices...")
-def calculate_municipal_indices(ano, selected_entes_ids, df_ibge_data, populacao_data):
+# --- Cliente da API do SICONFI (compartilhado entre sessões) ---
+@st.cache_resource
+def get_cliente_siconfi():
+    """Cria um único cliente com pool de conexões, limite de requisições e cache em disco."""
+    return ClienteSiconfi(cache=CacheRespostas())
+
+
+# --- Vetores de índices memorizados por (ente, ano), compartilhados entre sessões ---
+@st.cache_resource
+def get_memo_indices():
+    """Cria o memorizador de índices do processo."""
+    return MemoIndices()
+
+
+# --- Armazém de resultados pré-calculados (compartilhado entre sessões) ---
+@st.cache_resource
+def get_armazem():
+    """Abre o armazém local de índices, lido sem acesso à rede."""
+    return ArmazemResultados()
+
+
+@st.cache_resource
+def get_atualizacao_armazem():
     """
-    Realiza a busca de dados na API do SICONFI, calcula os índices
-    e retorna o DataFrame final.
+    Cria a tarefa que atualiza o armazém em segundo plano (uma por processo),
+    se ARMAZEM_INTERVALO_HORAS for maior que zero. Ela só começa a rodar em
+    `manter_armazem_atualizado`, quando a base do IBGE estiver carregada.
     """
-    resultados = []
-    
-    for ente in selected_entes_ids:
-        try:
-            # --- Importando os Anexos do RREO (6o Bimestre) ---
-            link_rreo_1 = f'https://apidatalake.tesouro.gov.br/ords/siconfi/tt/rreo?an_exercicio={ano}&nr_periodo=6&co_tipo_demonstrativo=RREO&no_anexo=RREO-Anexo%2001&id_ente={ente}'
-            df_rreo_1 = pd.DataFrame(requests.get(link_rreo_1, verify=False, timeout=10).json()["items"])
-            time.sleep(0.1)
-            link_rreo_2 = f'https://apidatalake.tesouro.gov.br/ords/siconfi/tt/rreo?an_exercicio={ano}&nr_periodo=6&co_tipo_demonstrativo=RREO&no_anexo=RREO-Anexo%2002&id_ente={ente}'
-            df_rreo_2 = pd.DataFrame(requests.get(link_rreo_2, verify=False, timeout=10).json()["items"])
-            time.sleep(0.1)
-            link_rreo_3 = f'https://apidatalake.tesouro.gov.br/ords/siconfi/tt/rreo?an_exercicio={ano}&nr_periodo=6&co_tipo_demonstrativo=RREO&no_anexo=RREO-Anexo%2003&id_ente={ente}'
-            df_rreo_3 = pd.DataFrame(requests.get(link_rreo_3, verify=False, timeout=10).json()["items"])
-            time.sleep(0.1)
-            # --- Importando os Anexos da DCA ---
-            link_dca_ab = f'https://apidatalake.tesouro.gov.br/ords/siconfi/tt/dca?an_exercicio={ano}&no_anexo=DCA-Anexo%20I-AB&id_ente={ente}'
-            df_dca_ab = pd.DataFrame(requests.get(link_dca_ab, verify=False, timeout=10).json()["items"])
-            time.sleep(0.1)
-        except (requests.exceptions.RequestException, KeyError) as e:
-            st.warning(f"Não foi possível obter dados para o município {ibge_to_nome.get(ente, ente)} no ano {ano}. Pulando este município. Erro: {e}")
-            continue
-
-        def get_value_or_zero(df, query, column='valor'):
-            if df.empty: return 0
-            filtered_df = df.query(query)
-            return filtered_df[column].sum() if not filtered_df.empty else 0
-
-        def get_value_str_or_zero(df, string_contains, query, column='valor'):
-            if df.empty: return 0
-            filtered_df = df[df["conta"].str.contains(string_contains, na=False)].query(query)
-            return filtered_df[column].sum() if not filtered_df.empty else 0
-
-        # --- Filtrar dados do PIB e População para o ente e ano atuais ---
-        pib_munic = df_ibge_data.query(f'`Código do Município` == {ente} and Ano == {ano}')
-        nro_habitantes_df = populacao_data.query(f'cod_ibge == "{ente}"')
-
-        # --- Extrair valores, tratando casos onde o DataFrame pode estar vazio ---
-        def get_value(df, column):
-            return df[column].sum() if not df.empty else 0
-
-        nro_habitantes = get_value(nro_habitantes_df, 'POPULAÇÃO')
-        pib_munic_valor = get_value(pib_munic, 'Produto Interno Bruto per capita, \na preços correntes\n(R$ 1,00)')
-        
-        if nro_habitantes == 0 and pib_munic_valor == 0:
-            st.warning(f"Não foi possível obter dados de população ou PIB para o município {ibge_to_nome.get(ente, ente)} no ano {ano}. Pulando este município.")
-            continue
-
-        # Extração de valores (com base na sua lógica original)
-        rec_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "TotalReceitas"')
-        iptu_rreo_3 = get_value_str_or_zero(df_rreo_3, "IPTU", 'coluna == "TOTAL (ÚLTIMOS 12 MESES)"')
-        iss_rreo_3 = get_value_str_or_zero(df_rreo_3, "ISS", 'coluna == "TOTAL (ÚLTIMOS 12 MESES)"')
-        div_ativa_trib_dca_ab = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.1.2.5.0.00.00" or cod_conta == "P1.2.1.1.1.04.00"')
-        despesa_total = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "TotalDespesas"')
-        despesa_investimentos = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "Investimentos"')
-        despesa_saude = get_value_or_zero(df_rreo_2, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Saúde" & cod_conta == "RREO2TotalDespesas"')
-        despesa_educacao = get_value_or_zero(df_rreo_2, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Educação" & cod_conta == "RREO2TotalDespesas"')
-        legislativo_rreo_2 = get_value_or_zero(df_rreo_2, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Legislativa" & cod_conta == "RREO2TotalDespesas"')
-        rec_trib_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitaTributaria"')
-        tranf_corr_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "TransferenciasCorrentes"')
-        at_circ = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.1.0.0.0.00.00"')
-        at_circ_disp = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.1.1.0.0.00.00"')
-        at_nao_circ = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.2.0.0.0.00.00"')
-        pass_circ = get_value_or_zero(df_dca_ab, 'cod_conta == "P2.1.0.0.0.00.00"')
-        pass_nao_circ = get_value_or_zero(df_dca_ab, 'cod_conta == "P2.2.0.0.0.00.00"')
-        vlr_restit = get_value_or_zero(df_dca_ab, 'cod_conta == "P2.1.8.8.0.00.00"')
-        estoques = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.1.5.0.0.00.00"')
-        ativo = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.0.0.0.0.00.00"')
-        passivo = get_value_or_zero(df_dca_ab, 'cod_conta == "P2.1.0.0.0.00.00" | cod_conta == "P2.2.0.0.0.00.00"')
-        imobilizado = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.2.3.0.0.00.00"')
-        investimentos_ativo = get_value_or_zero(df_dca_ab, 'cod_conta == "P1.1.4.0.0.00.00"')
-        pl = get_value_or_zero(df_dca_ab, 'cod_conta == "P2.3.0.0.0.00.00"')
-        dps_corr_liq_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "DespesasCorrentes"')
-        rec_corre_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasCorrentes"')
-        dps_capital_liq_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "DespesasDeCapital"')
-        rec_capital_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasDeCapital"')
-        dps_pess_e_encarg_liq_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "PessoalEEncargosSociais"')
-        dps_invest_liq_rreo_1 = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "Investimentos"')
-        rcl = get_value_or_zero(df_rreo_3, 'cod_conta == "RREO3ReceitaCorrenteLiquida" and coluna == "TOTAL (ÚLTIMOS 12 MESES)"')
-        rec_prevista = get_value_or_zero(df_rreo_1, 'coluna == "PREVISÃO ATUALIZADA (a)" & cod_conta == "TotalReceitas"')
-        desp_fixada = get_value_or_zero(df_rreo_1, 'coluna == "DOTAÇÃO INICIAL (d)" & cod_conta == "TotalDespesas"')
-        oper_cred = get_value_or_zero(df_rreo_1, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasDeOperacoesDeCredito"')
-        juros_e_encargos_div = get_value_or_zero(df_rreo_1, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "JurosEEncargosDaDivida"')
-        
-        def safe_division(numerator, denominator):
-            return numerator / denominator if denominator != 0 else 0
-
-        pib_per_capita = pib_munic_valor
-        receita_total_per_capita = safe_division(rec_rreo_1, nro_habitantes)
-        iptu_per_capita = safe_division(iptu_rreo_3, nro_habitantes)
-        iss_per_capita = safe_division(iss_rreo_3, nro_habitantes)
-        div_ativa_per_capita = safe_division(div_ativa_trib_dca_ab, nro_habitantes)
-        despesa_orcam_per_capita = safe_division(despesa_total, nro_habitantes)
-        investimentos_per_capita = safe_division(despesa_investimentos, nro_habitantes)
-        saude_per_capita = safe_division(despesa_saude, nro_habitantes)
-        educacao_per_capita = safe_division(despesa_educacao, nro_habitantes)
-        transf_legislativo_per_capita = safe_division(legislativo_rreo_2, nro_habitantes)
-        rec_trib_per_capita = safe_division(rec_trib_rreo_1, nro_habitantes)
-        rec_transf_per_capita = safe_division(tranf_corr_rreo_1, nro_habitantes)
-        liquidez_imediata = safe_division(at_circ_disp, pass_circ)
-        liquidez_recurso_terceiros = safe_division(at_circ_disp, vlr_restit)
-        liquidez_corrente = safe_division(at_circ, pass_circ)
-        liquidez_seca = safe_division((at_circ - estoques), pass_circ)
-        liquidez_geral = safe_division((at_circ + at_nao_circ), (pass_circ + pass_nao_circ))
-        solvencia_geral = safe_division(ativo, (pass_circ + pass_nao_circ))
-        endivid_geral = safe_division(passivo, ativo) * 100
-        composicao_exigibilidades = safe_division(pass_circ, passivo) * 100
-        imobilizacao_pl = safe_division((imobilizado + investimentos_ativo), pl) * 100
-        comprometimento_corrente = safe_division(dps_corr_liq_rreo_1, rec_corre_rreo_1) * 100
-        comprometimento_capital = safe_division(dps_capital_liq_rreo_1, rec_capital_rreo_1) * 100
-        gasto_pessoal_dps_orcam = safe_division(dps_pess_e_encarg_liq_rreo_1, dps_corr_liq_rreo_1) * 100
-        gasto_invest_dps_orcam = safe_division(dps_invest_liq_rreo_1, dps_corr_liq_rreo_1) * 100
-        gasto_pessoal_rcl = safe_division(dps_pess_e_encarg_liq_rreo_1, rcl) * 100
-        rec_corr_proprias = safe_division((rec_corre_rreo_1 - tranf_corr_rreo_1), rec_corre_rreo_1) * 100
-        exec_orcam_rec = safe_division(rec_rreo_1, rec_prevista) * 100
-        exec_orcam_desp = safe_division(despesa_total, desp_fixada) * 100
-        resultado_exec_orcam = safe_division(despesa_total, rec_rreo_1) * 100
-        autonomia_orcam = safe_division((rec_corre_rreo_1 - tranf_corr_rreo_1), despesa_total) * 100
-        amortizacao_e_refinanc_div = safe_division(oper_cred, despesa_total) * 100
-        encargos_div_dps_corr = safe_division(juros_e_encargos_div, despesa_total) * 100
-        
-        resultados.append({
-            "Município": ente, "A1_PIB per Capita": pib_per_capita, "A2_Receita Total per Capita": receita_total_per_capita,
-            "A3_IPTU per Capita": iptu_per_capita, "A4_ISS per Capita": iss_per_capita,
-            "A5_Dívida Ativa per Capita": div_ativa_per_capita, "B1_Despesas Orçamentárias per Capita": despesa_orcam_per_capita,
-            "B2_Investimentos per Capita": investimentos_per_capita, "B3_Gastos com Saúde per Capita": saude_per_capita,
-            "B4_Gastos com Educação per Capita": educacao_per_capita, "B5_Transferências para o Legislativo per Capita": transf_legislativo_per_capita,
-            "C1_Receita Tributária per Capita": rec_trib_per_capita, "C2_Receita de Transferências per Capita": rec_transf_per_capita,
-            "D1_Liquidez Instantânea ou Imediata": liquidez_imediata, "D3_Liquidez com recursos de terceiros": liquidez_recurso_terceiros,
-            "D4_Liquidez Corrente": liquidez_corrente, "E2_Liquidez Seca": liquidez_seca,
-            "E3_Liquidez Geral": liquidez_geral, "E6_Solvência Geral": solvencia_geral,
-            "F1_Endividamento Geral": endivid_geral, "F2_Composição das Exigibilidades": composicao_exigibilidades,
-            "F3_Imobilização do Patrimônio Líquido ou Capital Próprio": imobilizacao_pl,
-            "F4_Grau de Comprometimento da Categoria Econômica Corrente": comprometimento_corrente,
-            "F5_Grau de Comprometimento da Categoria Econômica de Capital": comprometimento_capital,
-            "G1_Grau de Gasto com Pessoal em relação a Despesa Orçamentária": gasto_pessoal_dps_orcam,
-            "G2_Grau de Investimento em relação a Despesa Orçamentária": gasto_invest_dps_orcam,
-            "G3_Grau de Gasto com Pessoal em relação a Receita corrente Líquida": gasto_pessoal_rcl,
-            "G4_Grau de Receitas Correntes Próprias ": rec_corr_proprias,
-            "H1_Grau de Execução Orçamentária da Receita": exec_orcam_rec, "H2_Grau de Execução Orçamentária da Despesa": exec_orcam_desp,
-            "H3_Grau do Resultado da Execução Orçamentária": resultado_exec_orcam, "H4_Grau de Autonomia Orçamentária": autonomia_orcam,
-            "H5_Grau de Amortização e refinanciamento de dívida": amortizacao_e_refinanc_div,
-            "H6_Grau de Encargos da dívida na despesa corrente": encargos_div_dps_corr,
-        })
-
-    if not resultados:
+    if INTERVALO_ATUALIZACAO_HORAS <= 0:
+        return None
+    return AtualizacaoPeriodica(
+        get_armazem(), available_years, list(ibge_to_nome), get_cliente_siconfi(),
+        base_ibge=None, intervalo=INTERVALO_ATUALIZACAO_HORAS * 3600
+    )
+
+
+def manter_armazem_atualizado(base_ibge):
+    """Inicia a atualização periódica, sempre com a base do IBGE mais recente."""
+    tarefa = get_atualizacao_armazem()
+    if tarefa is not None:
+        tarefa.iniciar(base_ibge)
+
+
+def avisar_municipio_ignorado(ente, ano, motivo):
+    """Exibe o aviso de município ignorado, conforme o motivo."""
+    if motivo == MOTIVO_SEM_DADOS:
+        st.warning(f"Não foi possível obter dados de população ou PIB para o município {ibge_to_nome.get(ente, ente)} no ano {ano}. Pulando este município.")
+    else:
+        st.warning(f"Não foi possível obter dados para o município {ibge_to_nome.get(ente, ente)} no ano {ano}. Pulando este município. Erro: {motivo}")
+
+
+# --- Cálculo incremental para a interface ---
+INTERVALO_ATUALIZACAO = 0.5  # segundos entre as atualizações da tabela parcial
+
+
+def _cancelar_analise():
+    # Roda no início da execução seguinte, depois que o clique já interrompeu a análise
+    st.session_state.analise_cancelada = True
+
+
+def calcular_com_progresso(ano, selected_entes_ids, base_ibge):
+    """
+    Lê do armazém os índices já calculados e obtém os demais (buscando no
+    SICONFI apenas os que ainda não foram calculados no processo para a
+    versão atual dos dados de PIB/População). Cada município aparece assim
+    que fica pronto, com barra de progresso e um botão de cancelamento.
+    Retorna a comparação em formato longo (ver `montar_comparacao`).
+
+    O clique em "Cancelar Análise" (ou em qualquer outro widget) faz o
+    Streamlit interromper esta execução no próximo comando st.*; a barra de
+    progresso é redesenhada enquanto se espera a API, para que a interrupção
+    não dependa da chegada do próximo município. Os municípios calculados até
+    ali são gravados no armazém mesmo quando a execução é interrompida.
+    """
+    st.session_state.analise_cancelada = False
+    st.sidebar.button("Cancelar Análise", on_click=_cancelar_analise)
+    progresso = st.progress(0.0, text="Buscando dados no SICONFI e calculando índices...")
+    parcial = st.empty()
+
+    armazenados, sem_dados_armazenados = get_armazem().consultar(ano, selected_entes_ids, base_ibge.versao)
+    conhecidos = set(armazenados.get("Município", [])) | set(sem_dados_armazenados)
+    faltantes = [ente for ente in selected_entes_ids if ente not in conhecidos]
+
+    vetores = [vetor for _, vetor in armazenados.set_index("Município").iterrows()] if not armazenados.empty else []
+    for ente in sem_dados_armazenados:
+        avisar_municipio_ignorado(ente, ano, MOTIVO_SEM_DADOS)
+    novos, novos_sem_dados = [], []
+    total = len(selected_entes_ids)
+    processados = len(conhecidos)
+    ultima_atualizacao = 0.0
+
+    def mostrar_progresso():
+        progresso.progress(processados / total, text=f"{processados} de {total} municípios processados")
+
+    resultados = get_memo_indices().calcular_progressivo(
+        ano, faltantes, get_cliente_siconfi(),
+        base_ibge.pib, base_ibge.populacao, base_ibge.versao, ao_aguardar=mostrar_progresso
+    )
+    try:
+        with METRICAS.medir("calcular_com_progresso"):
+            for ente, vetor, motivo in resultados:
+                processados += 1
+                if vetor is None:
+                    avisar_municipio_ignorado(ente, ano, motivo)
+                    if motivo == MOTIVO_SEM_DADOS:
+                        novos_sem_dados.append(ente)
+                else:
+                    vetores.append(vetor)
+                    novos.append(vetor)
+                    if processados == total or time.monotonic() - ultima_atualizacao >= INTERVALO_ATUALIZACAO:
+                        parcial.dataframe(
+                            pd.DataFrame(vetores).T.rename(columns=ibge_to_nome).style.format("{:.2f}"),
+                            use_container_width=True
+                        )
+                        ultima_atualizacao = time.monotonic()
+                mostrar_progresso()
+    finally:
+        # Encerra as buscas pendentes e guarda o que já foi calculado, inclusive se interrompido
+        resultados.close()
+        if novos or novos_sem_dados:
+            df_novos = pd.DataFrame(novos).rename_axis("Município").reset_index() if novos else pd.DataFrame()
+            get_armazem().gravar(ano, df_novos, novos_sem_dados, base_ibge.versao)
+
+    progresso.empty()
+    parcial.empty()
+    if not vetores:
         return pd.DataFrame()
+    ordem = {ente: i for i, ente in enumerate(selected_entes_ids)}
+    vetores.sort(key=lambda vetor: ordem[vetor.name])
+    return montar_comparacao(pd.DataFrame(vetores).rename_axis("Município").reset_index())
+
+
+def montar_comparacao(df_resultados):
+    """Compara os vetores selecionados entre si, em formato longo (uma linha por município e índice)."""
+    with METRICAS.medir("comparacao"):
+        longo = df_resultados.melt(id_vars=["Município"], var_name="Índice", value_name="Valor")
+        return comparar(longo)
+
+
+def descartar_exportacao():
+    """Apaga o arquivo exportado anteriormente pela sessão."""
+    if st.session_state.exportacao is not None:
+        remover_exportacao(st.session_state.exportacao[0])
+        st.session_state.exportacao = None
+
+
+def exibir_resultados_paginados(resultados, ano):
+    """Filtra, ordena e pagina os resultados no servidor; só a página visível é formatada."""
+    st.markdown("#### Consultar Resultados")
+    col_categorias, col_ufs, col_classes = st.columns(3)
+    categorias = col_categorias.multiselect("Grupos de índices", CATEGORIAS)
+    ufs = col_ufs.multiselect("UF", sorted(resultados["UF"].dropna().unique()))
+    classificacoes = col_classes.multiselect("Classificação", [1, 2, 3])
+    col_ordem, col_sentido, col_pagina = st.columns(3)
+    coluna_ordem = col_ordem.selectbox("Ordenar por", [None] + COLUNAS_VISUALIZACAO,
+                                       format_func=lambda coluna: coluna or "(ordem original)")
+    crescente = col_sentido.radio("Sentido", ["Crescente", "Decrescente"], horizontal=True) == "Crescente"
+
+    with METRICAS.medir("visualizacao") as medida:
+        selecao = ordenar(filtrar(resultados, categorias, ufs, classificacoes), coluna_ordem, crescente)
+        paginas = total_paginas(selecao)
+        numero = col_pagina.number_input("Página", min_value=1, max_value=paginas, value=1, step=1)
+        visivel = pagina(selecao, numero)
+        medida["linhas"] = len(visivel)
+    st.dataframe(formatar_pagina(visivel), use_container_width=True, hide_index=True)
+    st.caption(f"Página {numero} de {paginas} · {len(selecao)} linhas (até {LINHAS_POR_PAGINA} por página)")
+
+    col_formato, col_gerar, col_baixar = st.columns(3)
+    formato = col_formato.selectbox("Formato de exportação", list(FORMATOS_EXPORTACAO))
+    if col_gerar.button("Preparar arquivo"):
+        # Gravado em lotes em um arquivo temporário; a seleção inteira é exportada, sem formatação
+        descartar_exportacao()
+        remover_exportacoes_antigas()
+        path = novo_arquivo_exportacao(formato)
+        with METRICAS.medir("exportacao") as medida:
+            exportar(selecao, path, formato)
+            medida.update(linhas=len(selecao), bytes=os.path.getsize(path))
+        st.session_state.exportacao = (path, formato)
+    if st.session_state.exportacao is not None and os.path.exists(st.session_state.exportacao[0]):
+        path, formato_gerado = st.session_state.exportacao
+        with open(path, "rb") as arquivo:
+            col_baixar.download_button(
+                f"Baixar {formato_gerado.upper()}", arquivo, file_name=f"indices_{ano}.{formato_gerado}",
+                mime=FORMATOS_EXPORTACAO[formato_gerado]
+            )
+
+
+def montar_tabela_final(comparado, ano):
+    """Monta a tabela comparativa (Média, Variação (%), Classificação), com uma coluna por município."""
+    with METRICAS.medir("pivot"):
+        tabela_final = para_tabela_larga(comparado.assign(Município=comparado["Município"].replace(ibge_to_nome)))
 
-    df_resultados = pd.DataFrame(resultados)
-    df_resultados['Município'] = df_resultados['Município'].replace(ibge_to_nome)
-    df_pivot = df_resultados.melt(id_vars=["Município"], var_name="Índice", value_name="Valor")
-    tabela_final = df_pivot.pivot_table(index="Índice", columns="Município", values="Valor")
-    tabela_final['Média'] = tabela_final.mean(axis=1)
-
-    for municipio_col in [col for col in tabela_final.columns if col in ibge_to_nome.values()]:
-        tabela_final[f'{municipio_col}_Variação (%)'] = ((tabela_final[municipio_col] - tabela_final["Média"]) / tabela_final["Média"]) * 100
-        tabela_final[f'{municipio_col}_Variação (%)'] = tabela_final[f'{municipio_col}_Variação (%)'].fillna(0).replace([float('inf'), -float('inf')], 0)
-
-        def classificar_variacao(variacao):
-            variacao_absoluta = abs(variacao)
-            if variacao_absoluta <= 10: return 1
-            elif 10 < variacao_absoluta <= 30: return 2
-            else: return 3
-        
-        tabela_final[f'{municipio_col}_Classificação'] = tabela_final[f'{municipio_col}_Variação (%)'].apply(classificar_variacao)
-    
     tabela_final["Interpretações"] = tabela_final.index.map(interpretacoes)
     tabela_final["Fórmulas"] = tabela_final.index.map(formulas)
     tabela_final["Ano"] = ano
@@ -307,17 +331,12 @@ st.sidebar.header("Passo a Passo da Análise")
 # --------------------------
 st.sidebar.markdown("### 1. Carregar Dados Iniciais")
 if st.sidebar.button("Carregar Dados de PIB e População"):
-    # Caminhos CORRIGIDOS para a estrutura de pastas 'data/'
-    pib_file_path = 'data/PIB dos Municípios - base de dados 2010-2021.xlsx'
-    pop_file_path = 'data/POP_2022_Municipios.xlsx'
-
-    st.session_state.pib_data = load_pib_data(pib_file_path)
-    st.session_state.pop_data = load_pop_data(pop_file_path)
-
-    if not st.session_state.pib_data.empty and not st.session_state.pop_data.empty:
+    try:
+        base_ibge_atual()
         st.session_state.pib_pop_loaded = True
         st.sidebar.success("Dados de PIB e População carregados!")
-    else:
+    except FileNotFoundError as e:
+        st.error(f"Erro: Arquivo '{e}' não encontrado. Por favor, verifique o caminho.")
         st.session_state.pib_pop_loaded = False
         st.sidebar.error("Falha ao carregar arquivos. Verifique os caminhos.")
 
@@ -325,17 +344,27 @@ if not st.session_state.pib_pop_loaded:
     st.warning("⚠️ **Passo 1:** Carregue os dados de PIB e População clicando no botão ao lado.")
 else:
     st.success("✅ **Passo 1:** Dados de PIB e População carregados com sucesso!")
+    base_ibge = base_ibge_atual()
+    manter_armazem_atualizado(base_ibge)
     
     # --------------------------
     # Passo 2: Seleção de Parâmetros
     # --------------------------
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 2. Selecionar Parâmetros")
-    selected_year = st.sidebar.selectbox(
-        "Selecione o Ano de Análise",
-        options=available_years,
-        index=len(available_years) - 1
-    )
+    modo_painel = st.sidebar.checkbox("Modo painel (vários anos)")
+    if modo_painel:
+        selected_years = st.sidebar.select_slider(
+            "Selecione o Intervalo de Anos",
+            options=available_panel_years,
+            value=(available_panel_years[0], available_panel_years[-1])
+        )
+    else:
+        selected_year = st.sidebar.selectbox(
+            "Selecione o Ano de Análise",
+            options=available_years,
+            index=len(available_years) - 1
+        )
     selected_municipios_names = st.sidebar.multiselect(
         "Selecione os Municípios para Análise",
         options=all_municipios_names,
@@ -351,32 +380,72 @@ else:
     if st.sidebar.button("Gerar Análise dos Índices SICONFI"):
         if not selected_entes_ids:
             st.warning("Por favor, selecione pelo menos um município para análise.")
+        elif modo_painel:
+            with st.spinner("Buscando no SICONFI apenas os anos ainda não calculados..."):
+                painel, pendencias = atualizar_painel(
+                    selected_entes_ids, range(selected_years[0], selected_years[1] + 1),
+                    base_ibge.pib, base_ibge.populacao, get_cliente_siconfi(), base_ibge.versao
+                )
+            for ente, ano, motivo in pendencias:
+                st.warning(f"Não foi possível calcular os índices do município {ibge_to_nome.get(ente, ente)} no ano {ano}. Motivo: {motivo}")
+            st.session_state.painel = adicionar_crescimento(painel)
         else:
-            final_table = calculate_municipal_indices(
-                selected_year, selected_entes_ids, st.session_state.pib_data, st.session_state.pop_data
-            )
-            st.session_state.final_table = final_table
+            comparado = calcular_com_progresso(selected_year, selected_entes_ids, base_ibge)
+            if comparado.empty:
+                st.session_state.resultados = st.session_state.final_table = pd.DataFrame()
+            else:
+                st.session_state.resultados = preparar(comparado, base_ibge.populacao, ibge_to_nome)
+                pequena = comparado["Município"].nunique() <= LIMITE_TABELA_LARGA
+                st.session_state.final_table = montar_tabela_final(comparado, selected_year) if pequena else pd.DataFrame()
+            descartar_exportacao()
             st.session_state.siconfi_loaded = True
     
+    if st.session_state.analise_cancelada:
+        st.info("ℹ️ Análise cancelada. Os municípios já calculados ficam gravados e não serão buscados novamente.")
+        st.session_state.analise_cancelada = False
+
     # --------------------------
     # Exibição dos Resultados Finais
     # --------------------------
-    if st.session_state.siconfi_loaded and not st.session_state.final_table.empty:
+    if modo_painel and not st.session_state.painel.empty:
         st.markdown("---")
-        st.success("✅ **Passo 3:** Análise de índices gerada com sucesso!")
-        st.subheader(f"Resultados dos Índices para o Ano {selected_year}")
+        st.success("✅ **Passo 3:** Painel de índices gerado com sucesso!")
+        st.subheader(f"Painel dos Índices de {selected_years[0]} a {selected_years[1]}")
+        painel = st.session_state.painel.assign(
+            Município=st.session_state.painel["Município"].replace(ibge_to_nome)
+        )
         st.dataframe(
-            st.session_state.final_table.style.format(
-                {col: "{:.2f}" for col in st.session_state.final_table.select_dtypes(include='number').columns 
-                 if 'Variação' not in col and 'Classificação' not in col}
-            ),
-            use_container_width=True
+            painel.style.format({"Valor": "{:.2f}", "Variação Anual (%)": "{:.2f}", "CAGR (%)": "{:.2f}"}, na_rep="-"),
+            use_container_width=True,
+            hide_index=True
         )
+        st.markdown("""
+        **Variação Anual (%):** Variação do índice em relação ao ano anterior disponível.
+        **CAGR (%):** Taxa de crescimento anual composta desde o primeiro ano do intervalo.
+        """)
+
+    elif not modo_painel and st.session_state.siconfi_loaded and not st.session_state.resultados.empty:
+        st.markdown("---")
+        st.success("✅ **Passo 3:** Análise de índices gerada com sucesso!")
+        st.subheader(f"Resultados dos Índices para o Ano {selected_year}")
+        if not st.session_state.final_table.empty:
+            st.dataframe(
+                st.session_state.final_table.style.format(
+                    {col: "{:.2f}" for col in st.session_state.final_table.select_dtypes(include='number').columns 
+                     if 'Variação' not in col and 'Classificação' not in col}
+                ),
+                use_container_width=True
+            )
+        else:
+            st.caption(f"Com mais de {LIMITE_TABELA_LARGA} municípios, use a consulta abaixo ou exporte os resultados.")
+
+        exibir_resultados_paginados(st.session_state.resultados, selected_year)
 
         st.markdown("---")
         st.subheader("Glossário e Classificação")
         st.markdown("""
         **Variação (%):** Diferença percentual do índice do município em relação à média dos municípios selecionados.
+        Quando a média é zero e o índice do município não, a variação não é definida e fica sem classificação.
         **Classificação:**
         * **1:** Variação absoluta $\\le 10\\%$ da média.
         * **2:** Variação absoluta entre $10\\%$ e $30\\%$ da média.
@@ -386,10 +455,38 @@ else:
     elif st.session_state.pib_pop_loaded:
          st.info("ℹ️ **Passo 2 e 3:** Selecione o ano e os municípios na barra lateral e clique em 'Gerar Análise'.")
 
+# --------------------------
+# Diagnóstico (opcional)
+# --------------------------
+st.sidebar.markdown("---")
+if st.sidebar.checkbox("Mostrar diagnóstico de desempenho"):
+    with st.sidebar.expander("Diagnóstico", expanded=True):
+        resumo = METRICAS.resumo()
+        if resumo.empty:
+            st.caption("Nenhuma etapa executada ainda neste processo.")
+        else:
+            st.dataframe(
+                resumo[["etapa", "anexo", "chamadas", "segundos", "segundos_medio", "segundos_max",
+                        "bytes", "linhas", "tentativas", "erros", "cache_hits", "cache_misses"]],
+                hide_index=True, use_container_width=True
+            )
+            st.download_button("Exportar JSON", METRICAS.para_json(), file_name="metricas.json", mime="application/json")
+            st.download_button("Exportar Prometheus", METRICAS.para_prometheus(), file_name="metricas.prom", mime="text/plain")
+        if st.button("Zerar métricas"):
+            METRICAS.limpar()
+        tarefa = get_atualizacao_armazem()
+        if tarefa is not None and tarefa.ultima_execucao is not None:
+            st.caption(
+                f"Última atualização do armazém: {time.strftime('%d/%m/%Y %H:%M', time.localtime(tarefa.ultima_execucao))} "
+                f"({tarefa.ultimo_resumo})"
+            )
+
 st.markdown("---")
 st.info("""
 **Observação:**
 * Os arquivos `PIB dos Municípios - base de dados 2010-2021.xlsx` e `POP_2022_Municipios.xlsx` devem estar no mesmo diretório do script.
 * A aplicação usa cache para acelerar o carregamento dos dados após a primeira execução.
+* As respostas do SICONFI ficam gravadas em `data/cache/siconfi.sqlite`; com `SICONFI_OFFLINE=1` a aplicação usa apenas esse cache, sem acessar a rede.
+* Os índices calculados ficam em `data/cache/armazem.sqlite` e são lidos de lá sem acesso à rede; `ARMAZEM_INTERVALO_HORAS` (ou `python armazem.py`) recalcula em segundo plano apenas os municípios cujos dados mudaram no SICONFI.
 * Divisão por zero em cálculos é tratada para evitar erros.
 """)
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+Armazém local dos índices já calculados, com atualização em segundo plano.
+
+A interface lê os resultados daqui (uma consulta indexada, sem rede). A
+atualização busca de novo os anexos no SICONFI, compara o hash dos dados com o
+registrado no último cálculo e recalcula apenas os entes cujas declarações
+mudaram (homologação ou retificação) ou cuja base de PIB/população mudou.
+Resultados de exercícios ainda abertos valem pelo mesmo prazo do cache de
+respostas (`ttl_para_exercicio`); vencidos, a interface volta a calculá-los.
+
+Exemplos:
+    python armazem.py --ufs RJ --anos 2019-2021                 # uma atualização
+    python armazem.py --ufs RJ --anos 2019-2021 --intervalo 24  # repete a cada 24 horas
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from cache_siconfi import ttl_para_exercicio
+from indicadores import calcular_indices
+from metricas import METRICAS
+
+# --- Configurações do armazém ---
+ARMAZEM_PATH = os.environ.get("ARMAZEM_PATH", "data/cache/armazem.sqlite")
+# Intervalo entre atualizações automáticas (0 desativa)
+INTERVALO_ATUALIZACAO_HORAS = float(os.environ.get("ARMAZEM_INTERVALO_HORAS", 0))
+# Entes recalculados e gravados por transação durante a atualização
+LOTE_GRAVACAO = 200
+
+SITUACAO_OK = "ok"
+SITUACAO_SEM_DADOS = "sem_dados"
+
+logger = logging.getLogger("armazem")
+
+
+def hash_anexos(anexos):
+    """Hash do conteúdo dos anexos de um ente, independente da ordem das linhas."""
+    sha = hashlib.sha256()
+    for anexo in sorted(anexos):
+        df = anexos[anexo]
+        sha.update(anexo.encode())
+        if not df.empty:
+            ordenado = df.sort_values(list(df.columns)).reset_index(drop=True)
+            sha.update(pd.util.hash_pandas_object(ordenado, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+class ArmazemResultados:
+    """
+    Resultados por (ano, ente, índice) em SQLite (modo WAL), junto com o hash
+    dos dados do SICONFI e a versão da base do IBGE usados no cálculo.
+
+    Cada thread lê pela sua própria conexão, de modo que as leituras não
+    esperam a gravação feita pela atualização em segundo plano.
+    """
+
+    def __init__(self, path=ARMAZEM_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fontes (
+                ano INTEGER NOT NULL,
+                ente INTEGER NOT NULL,
+                hash_dados TEXT,
+                versao_ibge TEXT NOT NULL,
+                situacao TEXT NOT NULL,
+                atualizado_em REAL NOT NULL,
+                PRIMARY KEY (ano, ente)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS resultados (
+                ano INTEGER NOT NULL,
+                ente INTEGER NOT NULL,
+                ordem INTEGER NOT NULL,
+                indice TEXT NOT NULL,
+                valor REAL,
+                PRIMARY KEY (ano, ente, ordem)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+
+    def _leitura(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+        return conn
+
+    def consultar(self, ano, entes, versao_ibge):
+        """
+        Retorna (df_resultados, sem_dados) dos entes já armazenados para o ano
+        e a versão da base do IBGE, no mesmo formato de `calcular_indices`.
+        Entes ausentes do armazém, ou cujo resultado de exercício aberto é mais
+        antigo que o TTL, não aparecem em nenhum dos dois.
+        """
+        entes = [int(ente) for ente in dict.fromkeys(entes)]
+        if not entes:
+            return pd.DataFrame(), []
+        ttl = ttl_para_exercicio(ano)
+        atualizado_desde = time.time() - ttl if ttl is not None else 0
+        marcadores = ",".join("?" * len(entes))
+        with METRICAS.medir("armazem_leitura") as medida:
+            linhas = self._leitura().execute(
+                f"SELECT f.ente, f.situacao, r.ordem, r.indice, r.valor FROM fontes f "
+                f"LEFT JOIN resultados r ON r.ano = f.ano AND r.ente = f.ente "
+                f"WHERE f.ano = ? AND f.versao_ibge = ? AND f.atualizado_em >= ? AND f.ente IN ({marcadores}) "
+                f"ORDER BY f.ente, r.ordem",
+                (int(ano), versao_ibge, atualizado_desde, *entes),
+            ).fetchall()
+            medida["linhas"] = len(linhas)
+        dados = pd.DataFrame(linhas, columns=["ente", "situacao", "ordem", "indice", "valor"])
+        sem_dados = dados.loc[dados["situacao"] == SITUACAO_SEM_DADOS, "ente"].tolist()
+        dados = dados[dados["situacao"] == SITUACAO_OK]
+        if dados.empty:
+            return pd.DataFrame(), sem_dados
+        colunas = dados.drop_duplicates("ordem").sort_values("ordem")["indice"].tolist()
+        df = dados.pivot(index="ente", columns="indice", values="valor")[colunas]
+        # Mantém a ordem dos entes pedida
+        df = df.reindex([ente for ente in entes if ente in df.index])
+        return df.rename_axis(index="Município", columns=None).reset_index(), sem_dados
+
+    def fontes(self, ano):
+        """Retorna {ente: (hash_dados, versao_ibge)} registrados para o ano."""
+        linhas = self._leitura().execute(
+            "SELECT ente, hash_dados, versao_ibge FROM fontes WHERE ano = ?", (int(ano),)
+        ).fetchall()
+        return {ente: (hash_dados, versao) for ente, hash_dados, versao in linhas}
+
+    def gravar(self, ano, df_resultados, sem_dados, versao_ibge, hashes=None):
+        """
+        Substitui, em uma única transação, os resultados dos entes informados.
+        `hashes` ({ente: hash}) registra os dados de origem; sem ele, o ente
+        será recalculado na próxima atualização.
+        """
+        hashes = hashes or {}
+        agora = time.time()
+        ano = int(ano)
+        entes = [int(ente) for ente in df_resultados.get("Município", [])]
+        indices = list(df_resultados.columns[1:]) if entes else []
+        linhas = [
+            (ano, ente, ordem, indice, None if pd.isna(valor) else float(valor))
+            for ente, valores in zip(entes, df_resultados[indices].itertuples(index=False, name=None))
+            for ordem, (indice, valor) in enumerate(zip(indices, valores))
+        ]
+        fontes = [(ano, ente, hashes.get(ente), versao_ibge, SITUACAO_OK, agora) for ente in entes]
+        fontes += [(ano, int(ente), hashes.get(ente), versao_ibge, SITUACAO_SEM_DADOS, agora) for ente in sem_dados]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM resultados WHERE ano = ? AND ente = ?", [(ano, f[1]) for f in fontes]
+            )
+            self._conn.executemany("INSERT INTO resultados VALUES (?, ?, ?, ?, ?)", linhas)
+            self._conn.executemany("INSERT OR REPLACE INTO fontes VALUES (?, ?, ?, ?, ?, ?)", fontes)
+
+    def confirmar(self, ano, entes):
+        """Renova a data de atualização dos entes cujos dados não mudaram."""
+        agora = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE fontes SET atualizado_em = ? WHERE ano = ? AND ente = ?",
+                [(agora, int(ano), int(ente)) for ente in entes],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def atualizar_armazem(armazem, anos, entes, cliente, base_ibge, cancelar=None):
+    """
+    Busca novamente os anexos de todos os (ente, ano) e recalcula apenas os
+    entes cujos dados mudaram desde o último cálculo. Entes com falha de
+    acesso à API mantêm os resultados anteriores.
+
+    Retorna um dicionário com as contagens de inalterados, recalculados e falhas.
+    """
+    resumo = {"inalterados": 0, "recalculados": 0, "falhas": 0}
+    for ano in anos:
+        registrados = armazem.fontes(ano)
+        alterados, hashes, inalterados = {}, {}, []
+
+        def gravar_alterados():
+            df_resultados, sem_dados = calcular_indices(ano, alterados, base_ibge.pib, base_ibge.populacao)
+            armazem.gravar(ano, df_resultados, sem_dados, base_ibge.versao, hashes)
+            resumo["recalculados"] += len(alterados)
+            alterados.clear()
+            hashes.clear()
+
+        with METRICAS.medir("armazem_atualizacao"):
+            for ente, anexos, erro in cliente.buscar_anexos(ano, entes, cancelar=cancelar, renovar=True):
+                if erro is not None:
+                    logger.warning("Falha ao atualizar o ente %s em %s: %s", ente, ano, erro)
+                    resumo["falhas"] += 1
+                    continue
+                hash_dados = hash_anexos(anexos)
+                if registrados.get(ente) == (hash_dados, base_ibge.versao):
+                    resumo["inalterados"] += 1
+                    inalterados.append(ente)
+                    continue
+                alterados[ente] = anexos
+                hashes[ente] = hash_dados
+                if len(alterados) >= LOTE_GRAVACAO:
+                    gravar_alterados()
+            if alterados:
+                gravar_alterados()
+            armazem.confirmar(ano, inalterados)
+        if cancelar is not None and cancelar.is_set():
+            break
+    logger.info("Atualização do armazém: %(recalculados)d recalculados, %(inalterados)d inalterados, "
+                "%(falhas)d falhas", resumo)
+    return resumo
+
+
+class AtualizacaoPeriodica(threading.Thread):
+    """
+    Executa `atualizar_armazem` em segundo plano a cada `intervalo` segundos,
+    fora do caminho das requisições da interface. `iniciar()` pode ser chamado
+    de várias threads (a thread só é iniciada uma vez); `parar()` interrompe a
+    espera e as buscas em andamento.
+    """
+
+    def __init__(self, armazem, anos, entes, cliente, base_ibge, intervalo):
+        super().__init__(name="atualizacao-armazem", daemon=True)
+        self.armazem = armazem
+        self.anos = list(anos)
+        self.entes = list(entes)
+        self.cliente = cliente
+        self.base_ibge = base_ibge
+        self.intervalo = intervalo
+        self.ultima_execucao = None
+        self.ultimo_resumo = None
+        self._parar = threading.Event()
+        self._lock_inicio = threading.Lock()
+
+    def run(self):
+        while not self._parar.is_set():
+            try:
+                self.ultimo_resumo = atualizar_armazem(
+                    self.armazem, self.anos, self.entes, self.cliente, self.base_ibge, cancelar=self._parar
+                )
+            except Exception:
+                logger.exception("Falha na atualização do armazém")
+            self.ultima_execucao = time.time()
+            self._parar.wait(self.intervalo)
+
+    def iniciar(self, base_ibge):
+        """Atualiza a base do IBGE usada e inicia a thread, se ainda não iniciada."""
+        with self._lock_inicio:
+            self.base_ibge = base_ibge
+            if self.ident is None:
+                self.start()
+
+    def parar(self):
+        self._parar.set()
+
+
+def main(argv=None):
+    from cache_siconfi import CacheRespostas
+    from calcular_lote import interpretar_anos, selecionar_entes
+    from dados_ibge import PIB_FILE_PATH, POP_FILE_PATH, carregar_base_ibge
+    from siconfi import ClienteSiconfi
+
+    parser = argparse.ArgumentParser(description="Atualiza o armazém de índices com os dados do SICONFI.")
+    parser.add_argument("--anos", nargs="+", required=True, help="Anos ou intervalos, ex.: 2020 ou 2015-2021")
+    parser.add_argument("--ufs", nargs="*", help="Siglas das UFs (padrão: todas)")
+    parser.add_argument("--entes", nargs="*", type=int, help="Códigos IBGE dos municípios")
+    parser.add_argument("--armazem", default=ARMAZEM_PATH, help="Arquivo SQLite do armazém")
+    parser.add_argument("--pib", default=PIB_FILE_PATH, help="Planilha de PIB dos municípios")
+    parser.add_argument("--pop", default=POP_FILE_PATH, help="Planilha de população")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_ATUALIZACAO_HORAS,
+                        help="Repete a atualização a cada N horas (0: apenas uma vez)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        base_ibge = carregar_base_ibge(args.pib, args.pop)
+    except FileNotFoundError as e:
+        parser.error(f"Arquivo '{e}' não encontrado.")
+    entes = selecionar_entes(base_ibge.populacao, args.ufs, args.entes)
+    if not entes:
+        parser.error("Nenhum município corresponde aos filtros informados.")
+
+    armazem = ArmazemResultados(args.armazem)
+    cliente = ClienteSiconfi(cache=CacheRespostas())
+    anos = interpretar_anos(args.anos)
+    try:
+        while True:
+            atualizar_armazem(armazem, anos, entes, cliente, base_ibge)
+            if args.intervalo <= 0:
+                break
+            time.sleep(args.intervalo * 3600)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        cliente.close()
+        armazem.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""
+Benchmark offline do pipeline (busca -> extração -> tabela), contra um
+servidor local que imita a API do SICONFI a partir de fixtures sintéticas
+no formato da API.
+
+    python -m benchmark.executar                          # 5, 100, 1000 e 5570 entes, 2019-2021
+    python -m benchmark.executar --entes 5 100 --anos 2020 --latencia 50 --taxa-erro 0.02
+    python -m benchmark.fixtures --ente 3304557 --ano 2020  # troca as fixtures por respostas reais da API
+"""
@@ -0,0 +1,184 @@
+"""
+Mede o pipeline de `calcular_com_progresso` (busca dos anexos, extração,
+índices, comparação e tabela larga) contra o servidor local, para várias
+quantidades de entes sintéticos e anos, e grava um relatório JSON com o tempo
+total e o de cada etapa, comparados com os limites de `limites.json`.
+
+O caminho medido é o do cálculo a frio (sem cache em disco nem armazém): o
+mesmo `MemoIndices.calcular_progressivo` de app.py, que não pode ser importado
+fora do Streamlit. Sai com código 1 se algum limite for excedido.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import siconfi
+from benchmark.servidor import ITENS_POR_PAGINA, ServidorSiconfi
+from calcular_lote import interpretar_anos
+from comparacao import comparar, para_tabela_larga
+from dados_ibge import COLUNAS_PIB, BaseIbge
+from indicadores import COLUNA_PIB_PER_CAPITA, MOTIVO_SEM_DADOS, MemoIndices
+from metricas import METRICAS
+
+LIMITES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "limites.json")
+QUANTIDADES_ENTES = [5, 100, 1000, 5570]
+ANOS = ["2019-2021"]
+# Etapas cujo tempo depende da rede simulada (latência, erros e número de páginas
+# por anexo): só são comparadas com os limites na configuração em que foram
+# calibradas, sem atraso nem erros e com uma página por anexo
+ETAPAS_REDE = ("calcular_com_progresso", "busca", "http")
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE",
+       "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+
+
+def base_sintetica(quantidade, anos, semente=0):
+    """Base de PIB/população para `quantidade` entes sintéticos (códigos 9000000 em diante)."""
+    rng = np.random.default_rng(semente)
+    entes = 9_000_000 + np.arange(quantidade)
+    populacao = pd.DataFrame({
+        "UF": pd.array([UFS[i % len(UFS)] for i in range(quantidade)], dtype="string"),
+        "NOME DO MUNICÍPIO": pd.array([f"Município {ente}" for ente in entes], dtype="string"),
+        "POPULAÇÃO": rng.lognormal(9.5, 1.2, quantidade).round(),
+        "cod_ibge": entes,
+    })
+    colunas = list(COLUNAS_PIB)
+    pib = pd.DataFrame({
+        colunas[0]: np.repeat(anos, quantidade),
+        colunas[1]: np.tile(populacao["UF"].to_numpy(), len(anos)),
+        colunas[2]: np.tile(entes, len(anos)),
+        colunas[3]: np.tile(populacao["NOME DO MUNICÍPIO"].to_numpy(), len(anos)),
+        colunas[4]: rng.lognormal(13, 1.5, quantidade * len(anos)),
+        COLUNA_PIB_PER_CAPITA: rng.lognormal(10, 0.5, quantidade * len(anos)),
+    }).astype(COLUNAS_PIB)
+    return BaseIbge(pib, populacao, versao=f"sintetica-{quantidade}-{semente}")
+
+
+def medir_cenario(quantidade, anos, max_workers):
+    """Executa o pipeline para todos os anos e retorna o tempo total e o resumo por etapa."""
+    base = base_sintetica(quantidade, anos)
+    entes = base.populacao["cod_ibge"].tolist()
+    METRICAS.limpar()
+    memo = MemoIndices()
+    cliente = siconfi.ClienteSiconfi(max_workers=max_workers, requisicoes_por_segundo=0, offline=False)
+    falhas = sem_dados = 0
+    inicio = time.perf_counter()
+    try:
+        for ano in anos:
+            vetores = []
+            with METRICAS.medir("calcular_com_progresso"):
+                for _, vetor, motivo in memo.calcular_progressivo(
+                    ano, entes, cliente, base.pib, base.populacao, base.versao
+                ):
+                    if vetor is not None:
+                        vetores.append(vetor)
+                    elif motivo == MOTIVO_SEM_DADOS:
+                        sem_dados += 1
+                    else:
+                        falhas += 1
+            if vetores:
+                df_resultados = pd.DataFrame(vetores).rename_axis("Município").reset_index()
+                with METRICAS.medir("comparacao"):
+                    comparado = comparar(df_resultados.melt(id_vars=["Município"], var_name="Índice",
+                                                            value_name="Valor"))
+                with METRICAS.medir("pivot"):
+                    para_tabela_larga(comparado)
+    finally:
+        cliente.close()
+    segundos = time.perf_counter() - inicio
+    return segundos, falhas, sem_dados, METRICAS.resumo(por=("etapa",))
+
+
+def verificar_limites(etapas, entes_anos, limites, rede_simulada):
+    """
+    Compara o tempo de cada etapa com `fixo + por_ente_ano * entes_anos`.
+    Retorna a lista de violações.
+    """
+    violacoes = []
+    for etapa, limite in limites.get("etapas", {}).items():
+        if etapa not in etapas or (rede_simulada and etapa in ETAPAS_REDE):
+            continue
+        maximo = limite.get("fixo", 0.0) + limite.get("por_ente_ano", 0.0) * entes_anos
+        medido = etapas[etapa]["segundos"]
+        if medido > maximo:
+            violacoes.append({"etapa": etapa, "limite": round(maximo, 4), "medido": round(medido, 4)})
+    return violacoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do cálculo dos índices do SICONFI.")
+    parser.add_argument("--entes", nargs="+", type=int, default=QUANTIDADES_ENTES, help="Quantidades de entes sintéticos")
+    parser.add_argument("--anos", nargs="+", default=ANOS, help="Anos ou intervalos, ex.: 2020 ou 2019-2021")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Atraso de cada resposta do servidor (ms)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas HTTP 503 (0 a 1)")
+    parser.add_argument("--itens-por-pagina", type=int, default=ITENS_POR_PAGINA, help="Tamanho da página do ORDS")
+    parser.add_argument("--informar-total", action="store_true", help="Inclui totalResults (páginas em paralelo)")
+    parser.add_argument("--workers", type=int, default=siconfi.MAX_WORKERS)
+    parser.add_argument("--limites", default=LIMITES_PATH, help="Arquivo JSON com os limites por etapa")
+    parser.add_argument("--saida", default="benchmark_relatorio.json", help="Relatório JSON")
+    args = parser.parse_args(argv)
+
+    anos = interpretar_anos(args.anos)
+    with open(args.limites, encoding="utf-8") as f:
+        limites = json.load(f)
+    rede_simulada = (args.latencia > 0 or args.taxa_erro > 0 or args.informar_total
+                     or args.itens_por_pagina != ITENS_POR_PAGINA)
+    configuracao = {
+        "anos": anos, "latencia_ms": args.latencia, "taxa_erro": args.taxa_erro,
+        "itens_por_pagina": args.itens_por_pagina, "informar_total": args.informar_total, "workers": args.workers,
+    }
+
+    cenarios = []
+    with ServidorSiconfi(latencia=args.latencia / 1000, taxa_erro=args.taxa_erro,
+                         itens_por_pagina=args.itens_por_pagina, informar_total=args.informar_total) as servidor:
+        siconfi.BASE_URL = servidor.url
+        for quantidade in args.entes:
+            segundos, falhas, sem_dados, resumo = medir_cenario(quantidade, anos, args.workers)
+            entes_anos = quantidade * len(anos)
+            etapas = {
+                linha["etapa"]: {
+                    **{campo: linha[campo] for campo in ("chamadas", "segundos", "segundos_max", "bytes",
+                                                         "linhas", "tentativas", "erros")},
+                    "segundos_por_ente_ano": linha["segundos"] / entes_anos,
+                }
+                for linha in resumo.to_dict(orient="records")
+            }
+            violacoes = verificar_limites(etapas, entes_anos, limites, rede_simulada)
+            cenarios.append({
+                "entes": quantidade, "anos": len(anos), "segundos": segundos,
+                "entes_anos_por_segundo": entes_anos / segundos if segundos else None,
+                "falhas": falhas, "sem_dados": sem_dados, "etapas": etapas, "violacoes": violacoes,
+            })
+            print(f"{quantidade} entes x {len(anos)} anos: {segundos:.2f}s "
+                  f"({entes_anos / segundos:.1f} entes-ano/s), {falhas} falhas, "
+                  f"{len(violacoes)} limites excedidos", flush=True)
+            for violacao in violacoes:
+                print(f"  {violacao['etapa']}: {violacao['medido']}s > {violacao['limite']}s", flush=True)
+
+    relatorio = {
+        "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(), "plataforma": platform.platform(),
+            "pandas": pd.__version__, "numpy": np.__version__, "pyarrow": pa.__version__,
+        },
+        "configuracao": configuracao,
+        "limites": limites,
+        "limites_de_rede_aplicados": not rede_simulada,
+        "cenarios": cenarios,
+        "aprovado": not any(cenario["violacoes"] for cenario in cenarios),
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Relatório gravado em {args.saida}")
+    return 0 if relatorio["aprovado"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
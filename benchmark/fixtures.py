@@ -0,0 +1,72 @@
+"""
+Fixtures dos anexos usados no cálculo (RREO Anexos 01, 02 e 03 e DCA Anexo
+I-AB): os itens de um único ente, no formato e com todos os campos da API, que
+o servidor local replica para os entes sintéticos.
+
+As fixtures versionadas são sintéticas (contas, colunas e valores gerados no
+layout da API, não respostas reais de um município). `main` as substitui por
+respostas reais gravadas da API, quando há acesso a ela.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+
+from siconfi import ANEXOS, ClienteSiconfi, montar_url, url_com_offset
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _caminho(anexo):
+    return os.path.join(FIXTURES_DIR, f"{anexo}.json.gz")
+
+
+def carregar_fixture(anexo):
+    """Retorna a lista de itens da fixture do anexo."""
+    with gzip.open(_caminho(anexo), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def carregar_fixtures():
+    return {anexo: carregar_fixture(anexo) for anexo in ANEXOS}
+
+
+def gravar_fixture(anexo, itens):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with gzip.open(_caminho(anexo), "wt", encoding="utf-8") as f:
+        json.dump(itens, f, ensure_ascii=False)
+
+
+def gravar_da_api(ano, ente, cliente):
+    """
+    Busca na API (seguindo a paginação) os itens brutos de cada anexo do ente
+    e os grava como fixtures, sem descartar campos.
+    """
+    for anexo in ANEXOS:
+        url = montar_url(ano, anexo, ente)
+        pagina = cliente._get_json(url, ente=ente, anexo=anexo)
+        itens = list(pagina["items"])
+        while pagina.get("hasMore") and pagina["items"]:
+            pagina = cliente._get_json(url_com_offset(url, len(itens), pagina.get("limit") or len(pagina["items"])),
+                                       ente=ente, anexo=anexo)
+            itens.extend(pagina["items"])
+        gravar_fixture(anexo, itens)
+        print(f"{anexo}: {len(itens)} itens gravados")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regrava as fixtures do benchmark a partir da API do SICONFI.")
+    parser.add_argument("--ente", type=int, default=3304557, help="Código IBGE do ente usado como modelo")
+    parser.add_argument("--ano", type=int, default=2020)
+    args = parser.parse_args(argv)
+    cliente = ClienteSiconfi()
+    try:
+        gravar_da_api(args.ano, args.ente, cliente)
+    finally:
+        cliente.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
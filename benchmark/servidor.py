@@ -0,0 +1,152 @@
+"""
+Servidor HTTP local que imita os endpoints `rreo` e `dca` da API do SICONFI
+(ORDS), a partir das fixtures de `benchmark/fixtures` (sintéticas).
+
+Cada (ente, exercício) recebe os itens das fixtures com os valores multiplicados
+por fatores determinísticos, de modo que os entes sintéticos tenham índices
+diferentes entre si. Latência, taxa de erro (HTTP 503) e tamanho de página
+são configuráveis. O servidor roda em outro processo, para não disputar o
+GIL com o cliente medido.
+"""
+import json
+import multiprocessing
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import numpy as np
+
+from benchmark.fixtures import carregar_fixtures
+from siconfi import ANEXOS
+
+CAMINHO_BASE = "/ords/siconfi/tt"
+# Limite padrão de itens por página do ORDS
+ITENS_POR_PAGINA = 5000
+
+
+def _preparar_modelo(itens):
+    """
+    Serializa cada item uma única vez, sem os campos que variam por ente
+    (cod_ibge, exercicio e valor); a resposta só completa esses campos.
+    """
+    variaveis = ("cod_ibge", "exercicio", "valor")
+    prefixos = [
+        json.dumps({k: v for k, v in item.items() if k not in variaveis}, ensure_ascii=False)[:-1]
+        for item in itens
+    ]
+    valores = np.array([item["valor"] for item in itens], dtype=float)
+    return prefixos, valores
+
+
+def _itens_do_ente(modelo, ente, ano, semente, inicio, fim):
+    """Itens [inicio, fim) do ente já em JSON, com valores multiplicados por fatores determinísticos."""
+    prefixos, valores = modelo
+    rng = np.random.default_rng([ente, ano, semente])
+    fatores = rng.uniform(0.5, 1.5) * rng.uniform(0.8, 1.2, len(valores))
+    ajustados = np.round(valores * fatores, 2)[inicio:fim]
+    return [
+        f'{prefixo}, "cod_ibge": {ente}, "exercicio": {ano}, "valor": {valor!r}}}'
+        for prefixo, valor in zip(prefixos[inicio:fim], ajustados.tolist())
+    ]
+
+
+def _criar_handler(fixtures, latencia, taxa_erro, itens_por_pagina, informar_total, semente):
+    anexo_por_consulta = {
+        (f"{CAMINHO_BASE}/{endpoint}", params["no_anexo"]): anexo for anexo, (endpoint, params) in ANEXOS.items()
+    }
+    modelos = {anexo: _preparar_modelo(itens) for anexo, itens in fixtures.items()}
+    sorteio = random.Random(semente)
+
+    class HandlerSiconfi(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, status, corpo, itens_json=None):
+            if itens_json is None:
+                dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            else:
+                # Os itens já vêm serializados; só o restante passa pelo json.dumps
+                restante = json.dumps(corpo, ensure_ascii=False)[1:]
+                dados = f'{{"items": [{", ".join(itens_json)}], {restante}'.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if latencia:
+                time.sleep(latencia)
+            url = urlparse(self.path)
+            consulta = dict(parse_qsl(url.query))
+            anexo = anexo_por_consulta.get((url.path, consulta.get("no_anexo")))
+            if anexo is None:
+                return self._responder(404, {"message": "Recurso não encontrado"})
+            if taxa_erro and sorteio.random() < taxa_erro:
+                return self._responder(503, {"message": "Serviço indisponível (erro simulado)"})
+
+            total = len(modelos[anexo][0])
+            offset = int(consulta.pop("offset", 0))
+            limite = min(int(consulta.pop("limit", itens_por_pagina)), itens_por_pagina)
+            pagina = _itens_do_ente(modelos[anexo], int(consulta["id_ente"]), int(consulta["an_exercicio"]),
+                                    semente, offset, offset + limite)
+            tem_mais = offset + len(pagina) < total
+            base = f"http://{self.headers['Host']}{url.path}?{urlencode(consulta)}"
+            links = [{"rel": "self", "href": f"{base}&offset={offset}&limit={limite}"}]
+            if tem_mais:
+                links.append({"rel": "next", "href": f"{base}&offset={offset + len(pagina)}&limit={limite}"})
+            corpo = {"hasMore": tem_mais, "limit": limite, "offset": offset, "count": len(pagina), "links": links}
+            if informar_total:
+                corpo["totalResults"] = total
+            self._responder(200, corpo, itens_json=pagina)
+
+    return HandlerSiconfi
+
+
+def _servir(configuracao, fila):
+    handler = _criar_handler(carregar_fixtures(), **configuracao)
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    servidor.daemon_threads = True
+    fila.put(servidor.server_address[1])
+    servidor.serve_forever()
+
+
+class ServidorSiconfi:
+    """
+    Sobe o servidor local em um processo separado. Uso:
+
+        with ServidorSiconfi(latencia=0.05, taxa_erro=0.01) as servidor:
+            siconfi.BASE_URL = servidor.url
+    """
+
+    def __init__(self, latencia=0.0, taxa_erro=0.0, itens_por_pagina=ITENS_POR_PAGINA,
+                 informar_total=False, semente=0):
+        self.configuracao = {
+            "latencia": latencia, "taxa_erro": taxa_erro, "itens_por_pagina": itens_por_pagina,
+            "informar_total": informar_total, "semente": semente,
+        }
+        self.url = None
+        self._processo = None
+
+    def iniciar(self):
+        fila = multiprocessing.Queue()
+        self._processo = multiprocessing.Process(target=_servir, args=(self.configuracao, fila), daemon=True)
+        self._processo.start()
+        self.url = f"http://127.0.0.1:{fila.get(timeout=30)}{CAMINHO_BASE}"
+        return self
+
+    def parar(self):
+        if self._processo is not None:
+            self._processo.terminate()
+            self._processo.join()
+            self._processo = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
@@ -0,0 +1,154 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# --- Configurações do cache em disco ---
+CACHE_PATH = os.environ.get("SICONFI_CACHE_PATH", "data/cache/siconfi.sqlite")
+CACHE_MAX_BYTES = int(os.environ.get("SICONFI_CACHE_MAX_MB", 500)) * 1024 * 1024
+# Exercícios ainda abertos (ou recém-encerrados, sujeitos a retificação) expiram após este prazo
+TTL_EXERCICIO_ABERTO = int(os.environ.get("SICONFI_CACHE_TTL_HORAS", 24)) * 3600
+# Exercícios encerrados há pelo menos este número de anos são tratados como permanentes
+ANOS_PARA_FECHAMENTO = 2
+# A data de acesso só é renovada após este intervalo (s), e as renovações são
+# gravadas em lotes: a remoção por tamanho só precisa da ordem aproximada
+INTERVALO_ACESSO = 3600
+LOTE_ACESSOS = 500
+
+
+def ttl_para_exercicio(ano, ano_atual=None):
+    """Retorna o TTL em segundos para o exercício, ou None se for permanente."""
+    ano_atual = ano_atual or datetime.date.today().year
+    if int(ano) <= ano_atual - ANOS_PARA_FECHAMENTO:
+        return None
+    return TTL_EXERCICIO_ABERTO
+
+
+class CacheRespostas:
+    """
+    Armazena em SQLite os itens brutos retornados pela API do SICONFI,
+    indexados por (exercício, anexo, período, ente), com expiração por
+    exercício e remoção dos registros menos acessados ao exceder o tamanho máximo.
+
+    As leituras usam uma conexão por thread e não escrevem no banco; as datas
+    de acesso ficam pendentes em memória até a próxima gravação.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._acessos = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                exercicio INTEGER NOT NULL,
+                anexo TEXT NOT NULL,
+                periodo INTEGER NOT NULL,
+                ente INTEGER NOT NULL,
+                conteudo BLOB NOT NULL,
+                tamanho INTEGER NOT NULL,
+                gravado_em REAL NOT NULL,
+                expira_em REAL,
+                acessado_em REAL NOT NULL,
+                PRIMARY KEY (exercicio, anexo, periodo, ente)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_respostas_acesso ON respostas (acessado_em)")
+        self._conn.commit()
+
+    def _leitura(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+        return conn
+
+    def get(self, exercicio, anexo, periodo, ente, ignorar_validade=False):
+        """Retorna a lista de itens armazenada, ou None se ausente ou expirada."""
+        chave = (int(exercicio), anexo, int(periodo), int(ente))
+        agora = time.time()
+        linha = self._leitura().execute(
+            "SELECT conteudo, expira_em, acessado_em FROM respostas "
+            "WHERE exercicio = ? AND anexo = ? AND periodo = ? AND ente = ?",
+            chave,
+        ).fetchone()
+        if linha is None:
+            return None
+        conteudo, expira_em, acessado_em = linha
+        if not ignorar_validade and expira_em is not None and expira_em < agora:
+            return None
+        if agora - acessado_em >= INTERVALO_ACESSO:
+            with self._lock:
+                self._acessos[chave] = agora
+                if len(self._acessos) >= LOTE_ACESSOS:
+                    self._gravar_acessos()
+                    self._conn.commit()
+        return json.loads(zlib.decompress(conteudo))
+
+    def _gravar_acessos(self):
+        """Grava as datas de acesso pendentes; deve ser chamado com o lock."""
+        if self._acessos:
+            self._conn.executemany(
+                "UPDATE respostas SET acessado_em = ? "
+                "WHERE exercicio = ? AND anexo = ? AND periodo = ? AND ente = ?",
+                [(acessado_em, *chave) for chave, acessado_em in self._acessos.items()],
+            )
+            self._acessos.clear()
+
+    def put(self, exercicio, anexo, periodo, ente, itens):
+        """
+        Grava os itens de uma resposta e aplica a remoção por tamanho.
+        Respostas vazias sempre expiram como as de exercício aberto: o ente
+        pode homologar o demonstrativo depois, mesmo em exercício encerrado.
+        """
+        conteudo = zlib.compress(json.dumps(itens, ensure_ascii=False).encode("utf-8"))
+        agora = time.time()
+        ttl = ttl_para_exercicio(exercicio) if itens else TTL_EXERCICIO_ABERTO
+        expira_em = agora + ttl if ttl is not None else None
+        with self._lock:
+            self._gravar_acessos()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(exercicio), anexo, int(periodo), int(ente), conteudo, len(conteudo), agora, expira_em, agora),
+            )
+            self._remover_excedente()
+            self._conn.commit()
+
+    def _remover_excedente(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cursor = self._conn.execute(
+            "SELECT exercicio, anexo, periodo, ente, tamanho FROM respostas ORDER BY acessado_em"
+        )
+        remover = []
+        for exercicio, anexo, periodo, ente, tamanho in cursor:
+            if total <= self.max_bytes:
+                break
+            remover.append((exercicio, anexo, periodo, ente))
+            total -= tamanho
+        self._conn.executemany(
+            "DELETE FROM respostas WHERE exercicio = ? AND anexo = ? AND periodo = ? AND ente = ?",
+            remover,
+        )
+
+    def tamanho_total(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._gravar_acessos()
+            self._conn.commit()
+            self._conn.close()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
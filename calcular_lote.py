@@ -0,0 +1,230 @@
+"""
+Cálculo em lote dos índices municipais, sem a interface do Streamlit.
+
+Exemplos:
+    python calcular_lote.py --ufs RJ ES --anos 2019-2021
+    python calcular_lote.py --entes 3304557 3304904 --anos 2020
+    python calcular_lote.py --anos 2021 --formato parquet     # todos os municípios do Brasil
+    python calcular_lote.py --ufs SP --anos 2021 --metricas metricas.prom
+    python calcular_lote.py --anos 2019-2021 --pares uf      # compara cada município com os da sua UF
+
+Os entes baixados são calculados em lotes de LOTE_CALCULO; os resultados de
+cada lote são acrescentados a `<saida>/indices.csv`, e `<saida>/checkpoint.csv`
+registra os pares (ente, ano) já processados. Uma execução interrompida retoma
+a partir do último lote gravado (os anexos já baixados vêm do cache em disco).
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+import urllib3
+
+from cache_siconfi import CacheRespostas
+from comparacao import CRITERIOS_PARES, comparar, grupos_de_pares
+from dados_ibge import PIB_FILE_PATH, POP_FILE_PATH, carregar_base_ibge
+from indicadores import calcular_indices
+from metricas import METRICAS
+from siconfi import MAX_WORKERS, OFFLINE, REQUISICOES_POR_SEGUNDO, ClienteSiconfi
+
+INTERVALO_RELATORIO = 10  # segundos entre os relatórios de vazão
+LOTE_CALCULO = 200  # entes calculados (e gravados no checkpoint) de uma só vez
+
+logger = logging.getLogger("calcular_lote")
+
+
+def interpretar_anos(valores):
+    """Converte argumentos como '2020' ou '2015-2021' em uma lista ordenada de anos."""
+    anos = set()
+    for valor in valores:
+        inicio, _, fim = valor.partition("-")
+        anos.update(range(int(inicio), int(fim or inicio) + 1))
+    return sorted(anos)
+
+
+def selecionar_entes(populacao, ufs=None, codigos=None):
+    """Seleciona os códigos IBGE pelas UFs e/ou códigos informados (todos, se nenhum filtro)."""
+    if not ufs and not codigos:
+        return populacao["cod_ibge"].tolist()
+    mascara = populacao["UF"].isin([uf.upper() for uf in ufs or []])
+    mascara |= populacao["cod_ibge"].isin(codigos or [])
+    return populacao.loc[mascara, "cod_ibge"].tolist()
+
+
+class Checkpoint:
+    """Registro em CSV dos pares (ente, ano) já processados."""
+
+    def __init__(self, path):
+        self.path = path
+        self.concluidos = set()
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                for linha in csv.DictReader(f):
+                    self.concluidos.add((int(linha["ente"]), int(linha["ano"])))
+        novo = not os.path.exists(path)
+        self._arquivo = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._arquivo)
+        if novo:
+            self._writer.writerow(["ente", "ano", "status"])
+            self._arquivo.flush()
+
+    def concluido(self, ente, ano):
+        return (ente, ano) in self.concluidos
+
+    def registrar_lote(self, ano, status_por_ente):
+        """Registra vários entes do mesmo ano com uma única sincronização em disco."""
+        self._writer.writerows([ente, ano, status] for ente, status in status_por_ente.items())
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self.concluidos.update((ente, ano) for ente in status_por_ente)
+
+    def close(self):
+        self._arquivo.close()
+
+
+def gravar_resultado(path, df):
+    """Acrescenta as linhas ao CSV de resultados, criando o cabeçalho se necessário."""
+    df.to_csv(path, mode="a", header=not os.path.exists(path), index=False, encoding="utf-8")
+
+
+def ler_resultados(csv_path):
+    """Lê o CSV incremental, mantendo a última linha gravada por (ente, ano)."""
+    df = pd.read_csv(csv_path, encoding="utf-8")
+    return df.drop_duplicates(subset=["Município", "Ano"], keep="last")
+
+
+def consolidar(csv_path, parquet_path):
+    """Gera o Parquet final a partir do CSV incremental."""
+    df = ler_resultados(csv_path)
+    df.to_parquet(parquet_path, index=False)
+    return len(df)
+
+
+def gerar_comparacao(csv_path, destino, populacao, criterio):
+    """Compara todos os resultados com seus pares (por ano) e grava em CSV ou Parquet."""
+    longo = ler_resultados(csv_path).melt(id_vars=["Município", "Ano"], var_name="Índice", value_name="Valor")
+    comparado = comparar(longo, grupos_de_pares(populacao, criterio))
+    if destino.endswith(".parquet"):
+        comparado.to_parquet(destino, index=False)
+    else:
+        comparado.to_csv(destino, index=False, encoding="utf-8")
+    return len(comparado)
+
+
+def processar_lote(ano, anexos_por_ente, df_pib, df_pop, csv_path, checkpoint):
+    """Calcula os índices de um lote de entes em uma só chamada, grava os resultados e o checkpoint."""
+    df_resultados, sem_dados = calcular_indices(ano, anexos_por_ente, df_pib, df_pop)
+    if not df_resultados.empty:
+        df_resultados.insert(1, "Ano", ano)
+        gravar_resultado(csv_path, df_resultados)
+    sem_dados = set(sem_dados)
+    checkpoint.registrar_lote(ano, {ente: "sem_dados" if ente in sem_dados else "ok" for ente in anexos_por_ente})
+    return len(anexos_por_ente)
+
+
+def executar(anos, entes, df_pib, df_pop, cliente, saida, formato="csv", tamanho_lote=LOTE_CALCULO):
+    """Processa todos os pares (ente, ano) pendentes e retorna quantos foram concluídos."""
+    os.makedirs(saida, exist_ok=True)
+    csv_path = os.path.join(saida, "indices.csv")
+    checkpoint = Checkpoint(os.path.join(saida, "checkpoint.csv"))
+    processados = falhas = 0
+    inicio = ultimo_relatorio = time.monotonic()
+
+    try:
+        for ano in anos:
+            pendentes = [ente for ente in entes if not checkpoint.concluido(ente, ano)]
+            logger.info("Ano %s: %d entes pendentes de %d", ano, len(pendentes), len(entes))
+            lote = {}
+            for ente, anexos, erro in cliente.buscar_anexos(ano, pendentes):
+                if erro is not None:
+                    # Não entra no checkpoint: será tentado de novo na próxima execução
+                    logger.warning("Falha ao obter dados do ente %s em %s: %s", ente, ano, erro)
+                    falhas += 1
+                    continue
+                lote[ente] = anexos
+                if len(lote) < tamanho_lote:
+                    continue
+                processados += processar_lote(ano, lote, df_pib, df_pop, csv_path, checkpoint)
+                lote = {}
+
+                agora = time.monotonic()
+                if agora - ultimo_relatorio >= INTERVALO_RELATORIO:
+                    logger.info("%d entes concluídos (%.2f entes/s), %d falhas",
+                                processados, processados / (agora - inicio), falhas)
+                    ultimo_relatorio = agora
+            if lote:
+                processados += processar_lote(ano, lote, df_pib, df_pop, csv_path, checkpoint)
+    finally:
+        checkpoint.close()
+        duracao = time.monotonic() - inicio
+        logger.info("Fim: %d entes concluídos em %.1fs (%.2f entes/s), %d falhas",
+                    processados, duracao, processados / duracao if duracao else 0, falhas)
+
+    if formato == "parquet" and os.path.exists(csv_path):
+        linhas = consolidar(csv_path, os.path.join(saida, "indices.parquet"))
+        logger.info("Parquet consolidado com %d linhas", linhas)
+    return processados
+
+
+def gravar_metricas(path):
+    """Exporta as métricas coletadas em JSON ou, para arquivos .prom, no formato do Prometheus."""
+    conteudo = METRICAS.para_prometheus() if path.endswith(".prom") else METRICAS.para_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+    logger.info("Métricas gravadas em %s", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcula os índices do SICONFI para vários municípios e anos.")
+    parser.add_argument("--anos", nargs="+", required=True, help="Anos ou intervalos, ex.: 2020 ou 2015-2021")
+    parser.add_argument("--ufs", nargs="*", help="Siglas das UFs (padrão: todas)")
+    parser.add_argument("--entes", nargs="*", type=int, help="Códigos IBGE dos municípios")
+    parser.add_argument("--saida", default="resultados", help="Diretório de saída (padrão: resultados)")
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--pib", default=PIB_FILE_PATH, help="Planilha de PIB dos municípios")
+    parser.add_argument("--pop", default=POP_FILE_PATH, help="Planilha de população")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rps", type=float, default=REQUISICOES_POR_SEGUNDO, help="Máximo de requisições por segundo")
+    parser.add_argument("--offline", action="store_true", default=OFFLINE, help="Usa apenas o cache em disco")
+    parser.add_argument("--metricas", help="Grava as métricas por etapa ao final (.json ou .prom)")
+    parser.add_argument("--pares", choices=CRITERIOS_PARES,
+                        help="Gera <saida>/comparacao com média, mediana, percentil, z-score e classificação por grupo de pares")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    try:
+        base_ibge = carregar_base_ibge(args.pib, args.pop)
+    except FileNotFoundError as e:
+        parser.error(f"Arquivo '{e}' não encontrado.")
+
+    entes = selecionar_entes(base_ibge.populacao, args.ufs, args.entes)
+    if not entes:
+        parser.error("Nenhum município corresponde aos filtros informados.")
+
+    cliente = ClienteSiconfi(max_workers=args.workers, requisicoes_por_segundo=args.rps,
+                             cache=CacheRespostas(), offline=args.offline)
+    try:
+        executar(interpretar_anos(args.anos), entes, base_ibge.pib, base_ibge.populacao,
+                 cliente, args.saida, args.formato)
+        csv_path = os.path.join(args.saida, "indices.csv")
+        if args.pares and os.path.exists(csv_path):
+            destino = os.path.join(args.saida, f"comparacao.{args.formato}")
+            linhas = gerar_comparacao(csv_path, destino, base_ibge.populacao, args.pares)
+            logger.info("Comparação por pares (%s) gravada em %s: %d linhas", args.pares, destino, linhas)
+    except KeyboardInterrupt:
+        logger.warning("Interrompido; execute novamente para retomar do checkpoint.")
+        return 130
+    finally:
+        cliente.close()
+        if args.metricas:
+            gravar_metricas(args.metricas)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# --- Comparação entre pares, em formato longo ---
+# Entrada: uma linha por (Município, [Ano,] Índice) com o Valor. Cada índice é
+# comparado com os demais municípios do mesmo grupo de pares (e do mesmo ano).
+
+# Faixas de população usadas pelo IBGE nas estatísticas municipais
+FAIXAS_POPULACAO = [0, 5_000, 10_000, 20_000, 50_000, 100_000, 500_000, np.inf]
+ROTULOS_FAIXAS = [
+    "Até 5 mil", "5 a 10 mil", "10 a 20 mil", "20 a 50 mil",
+    "50 a 100 mil", "100 a 500 mil", "Mais de 500 mil",
+]
+CRITERIOS_PARES = ("todos", "uf", "faixa")
+GRUPO_PADRAO = "Todos"
+
+# Limites da classificação pela variação absoluta em relação à média (%)
+LIMITE_CLASSE_1 = 10
+LIMITE_CLASSE_2 = 30
+
+
+def grupos_de_pares(populacao, criterio):
+    """
+    Retorna uma Series cod_ibge -> grupo de pares segundo o critério:
+    "todos" (um único grupo), "uf" ou "faixa" (faixa populacional).
+    UF ou população ausente fica como NaN (ver "Sem grupo" em `comparar`).
+    """
+    if criterio not in CRITERIOS_PARES:
+        raise ValueError(f"Critério de pares desconhecido: {criterio!r}")
+    codigos = populacao["cod_ibge"]
+    if criterio == "uf":
+        grupos = populacao["UF"]
+    elif criterio == "faixa":
+        grupos = pd.cut(populacao["POPULAÇÃO"], FAIXAS_POPULACAO, labels=ROTULOS_FAIXAS)
+    else:
+        grupos = pd.Series(GRUPO_PADRAO, index=populacao.index)
+    grupos = grupos.astype(object).where(grupos.notna(), np.nan)
+    return pd.Series(grupos.to_numpy(), index=codigos.to_numpy(), name="Grupo")
+
+
+def classificar(variacao):
+    """
+    Classifica vetorialmente a variação: 1 (|v| <= 10%), 2 (10% < |v| <= 30%)
+    ou 3 (|v| > 30%); variação indefinida (NaN) fica sem classificação.
+    """
+    absoluta = np.abs(np.asarray(variacao, dtype=float))
+    classes = pd.array(np.select([absoluta <= LIMITE_CLASSE_1, absoluta <= LIMITE_CLASSE_2], [1, 2], 3), dtype="Int8")
+    classes[np.isnan(absoluta)] = pd.NA
+    return classes
+
+
+def comparar(longo, grupos=None):
+    """
+    Compara cada (Município, [Ano,] Índice) com seus pares em uma única passada.
+
+    `grupos` é uma Series cod_ibge -> grupo (ver `grupos_de_pares`); sem ela,
+    todos os municípios formam um único grupo. Acrescenta as colunas Grupo,
+    Média, Mediana, Percentil, Z-score, Variação (%) e Classificação.
+
+    A variação é NaN quando a média do grupo é NaN, ou zero com valor diferente
+    de zero (se valor e média são zero, a variação é 0). O z-score é NaN quando
+    o desvio-padrão do grupo é zero.
+    """
+    df = longo.copy()
+    if grupos is None:
+        df["Grupo"] = GRUPO_PADRAO
+    else:
+        df["Grupo"] = df["Município"].map(grupos).fillna("Sem grupo")
+    chaves = (["Ano"] if "Ano" in df.columns else []) + ["Grupo", "Índice"]
+    por_grupo = df.groupby(chaves, sort=False, observed=True)["Valor"]
+
+    valor = df["Valor"].to_numpy(dtype=float)
+    media = por_grupo.transform("mean").to_numpy(dtype=float)
+    desvio = por_grupo.transform("std", ddof=0).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variacao = np.where(media != 0, (valor - media) / media * 100, np.where(valor == 0, 0.0, np.nan))
+        z_score = np.where(desvio > 0, (valor - media) / desvio, np.nan)
+    variacao[np.isnan(media)] = np.nan
+
+    return df.assign(**{
+        "Média": media,
+        "Mediana": por_grupo.transform("median").to_numpy(dtype=float),
+        "Percentil": por_grupo.rank(pct=True).to_numpy(dtype=float) * 100,
+        "Z-score": z_score,
+        "Variação (%)": variacao,
+        "Classificação": classificar(variacao),
+    })
+
+
+def para_tabela_larga(comparado):
+    """
+    Converte o resultado de `comparar` (um único ano e grupo) no layout de
+    exibição: uma linha por Índice, uma coluna por município, a Média e, para
+    cada município, as colunas "<município>_Variação (%)" e "<município>_Classificação".
+    """
+    valores = comparado.pivot(index="Índice", columns="Município", values="Valor")
+    media = comparado.groupby("Índice")["Média"].first()
+    variacoes = comparado.pivot(index="Índice", columns="Município", values="Variação (%)")
+    classificacoes = comparado.pivot(index="Índice", columns="Município", values="Classificação")
+    colunas = {municipio: valores[municipio] for municipio in valores.columns}
+    colunas["Média"] = media
+    for municipio in valores.columns:
+        colunas[f"{municipio}_Variação (%)"] = variacoes[municipio]
+        colunas[f"{municipio}_Classificação"] = classificacoes[municipio]
+    return pd.DataFrame(colunas).rename_axis(index="Índice", columns="Município")
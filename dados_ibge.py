@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+
+# --- Snapshots colunares das planilhas do IBGE ---
+# Cada planilha é convertida uma única vez para um arquivo Arrow (Feather v2, sem
+# compressão, para permitir memory-map). Ao lado fica um .json com o tamanho,
+# a data de modificação e o hash da planilha de origem; se ela mudar, o
+# snapshot é refeito.
+SNAPSHOT_DIR = os.environ.get("IBGE_SNAPSHOT_DIR", "data/cache/ibge")
+
+# Caminhos das planilhas na estrutura de pastas 'data/'
+PIB_FILE_PATH = 'data/PIB dos Municípios - base de dados 2010-2021.xlsx'
+POP_FILE_PATH = 'data/POP_2022_Municipios.xlsx'
+
+COLUNAS_PIB = {
+    'Ano': 'int16',
+    'Sigla da Unidade da Federação': 'string',
+    'Código do Município': 'int64',
+    'Nome do Município': 'string',
+    'Produto Interno Bruto, \na preços correntes\n(R$ 1.000)': 'float64',
+    'Produto Interno Bruto per capita, \na preços correntes\n(R$ 1,00)': 'float64',
+}
+
+
+def _hash_arquivo(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _caminhos_snapshot(file_path):
+    nome = os.path.splitext(os.path.basename(file_path))[0]
+    base = os.path.join(SNAPSHOT_DIR, nome)
+    return base + ".arrow", base + ".json"
+
+
+def _snapshot_valido(file_path, meta_path):
+    """Confere se o snapshot corresponde à versão atual da planilha de origem."""
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    if meta.get("tamanho") == stat.st_size and meta.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    # Data de modificação diferente, mas conteúdo possivelmente igual (ex.: cópia no deploy)
+    if meta.get("tamanho") == stat.st_size and meta.get("sha256") == _hash_arquivo(file_path):
+        meta["mtime_ns"] = stat.st_mtime_ns
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return True
+    return False
+
+
+def _versao_snapshot(file_path):
+    """Hash da planilha de origem registrado no snapshot."""
+    with open(_caminhos_snapshot(file_path)[1], encoding="utf-8") as f:
+        return json.load(f)["sha256"]
+
+
+def _carregar_snapshot(file_path, converter):
+    """Lê o snapshot via memory-map, gerando-o a partir da planilha quando necessário."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    arrow_path, meta_path = _caminhos_snapshot(file_path)
+    if not (os.path.exists(arrow_path) and _snapshot_valido(file_path, meta_path)):
+        df = converter(file_path)
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        feather.write_feather(df, arrow_path + ".tmp", compression="uncompressed")
+        os.replace(arrow_path + ".tmp", arrow_path)
+        stat = os.stat(file_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"tamanho": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                       "sha256": _hash_arquivo(file_path)}, f)
+    return feather.read_table(arrow_path, memory_map=True)
+
+
+def converter_pib(file_path):
+    """Lê da planilha de PIB apenas as colunas usadas, já com os tipos corretos."""
+    df_pib = pd.read_excel(file_path, usecols=list(COLUNAS_PIB))
+    return df_pib[list(COLUNAS_PIB)].astype(COLUNAS_PIB)
+
+
+def converter_pop(file_path):
+    """Lê a planilha de população, descarta o rodapé e monta o código IBGE inteiro."""
+    populacao = pd.read_excel(file_path, header=1, dtype=object)
+    cod_uf = pd.to_numeric(populacao['COD. UF'], errors='coerce')
+    cod_munic = pd.to_numeric(populacao['COD. MUNIC'], errors='coerce')
+    # Linhas de rodapé (notas e fonte) não têm códigos numéricos
+    validas = cod_uf.notna() & cod_munic.notna()
+    return pd.DataFrame({
+        'UF': populacao.loc[validas, 'UF'].astype('string'),
+        'NOME DO MUNICÍPIO': populacao.loc[validas, 'NOME DO MUNICÍPIO'].astype('string'),
+        'POPULAÇÃO': pd.to_numeric(populacao.loc[validas, 'POPULAÇÃO'], errors='coerce'),
+        'cod_ibge': (cod_uf[validas] * 100000 + cod_munic[validas]).astype('int64'),
+    }).reset_index(drop=True)
+
+
+def carregar_pib_snapshot(file_path):
+    """Retorna a tabela Arrow de PIB (memory-mapped)."""
+    return _carregar_snapshot(file_path, converter_pib)
+
+
+def carregar_pop_snapshot(file_path):
+    """Retorna a tabela Arrow de população (memory-mapped)."""
+    return _carregar_snapshot(file_path, converter_pop)
+
+
+def para_pandas(tabela):
+    """Converte uma tabela Arrow para DataFrame, mantendo um bloco por coluna (sem consolidação)."""
+    return tabela.to_pandas(split_blocks=True)
+
+
+class BaseIbge:
+    """
+    PIB e população carregados uma única vez e tratados como somente leitura.
+    `versao` identifica o conteúdo das planilhas de origem e serve de chave
+    para os cálculos, no lugar do conteúdo dos DataFrames.
+    """
+
+    def __init__(self, pib, populacao, versao):
+        self.pib = pib
+        self.populacao = populacao
+        self.versao = versao
+
+
+def assinatura_arquivos(*paths):
+    """
+    Tamanho e data de modificação de cada arquivo, para compor chaves de cache
+    que mudam quando uma planilha é substituída.
+    """
+    assinatura = []
+    for path in paths:
+        stat = os.stat(path)
+        assinatura.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(assinatura)
+
+
+def carregar_base_ibge(pib_path, pop_path):
+    """Carrega os snapshots de PIB e população e calcula o token de versão."""
+    pib = para_pandas(carregar_pib_snapshot(pib_path))
+    populacao = para_pandas(carregar_pop_snapshot(pop_path))
+    versao = hashlib.sha256(
+        (_versao_snapshot(pib_path) + _versao_snapshot(pop_path)).encode()
+    ).hexdigest()[:16]
+    return BaseIbge(pib, populacao, versao)
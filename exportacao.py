@@ -0,0 +1,117 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+# --- Exportação em lotes, sem montar uma cópia formatada da tabela ---
+LINHAS_POR_LOTE = 10_000
+# Limite de linhas de uma planilha do Excel (descontado o cabeçalho)
+LIMITE_LINHAS_XLSX = 1_048_575
+FORMATOS_EXPORTACAO = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _lotes(df, tamanho):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+
+def exportar_csv(df, path, tamanho=LINHAS_POR_LOTE):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, lote in enumerate(_lotes(df, tamanho)):
+            lote.to_csv(f, header=(i == 0), index=False)
+        if df.empty:
+            df.to_csv(f, index=False)
+
+
+def exportar_parquet(df, path, tamanho=LINHAS_POR_LOTE):
+    """Grava um row group por lote, com o esquema do DataFrame inteiro."""
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, esquema) as writer:
+        for lote in _lotes(df, tamanho):
+            writer.write_table(pa.Table.from_pandas(lote, schema=esquema, preserve_index=False))
+
+
+def _linhas_planilha(lote):
+    # Objetos Python nativos, com células vazias no lugar de NaN/NA
+    objetos = lote.astype(object)
+    return objetos.where(lote.notna(), None).itertuples(index=False, name=None)
+
+
+def exportar_xlsx(df, path, tamanho=LINHAS_POR_LOTE, planilha="Resultados"):
+    """Usa o modo write-only do openpyxl, que grava as linhas sem mantê-las em memória."""
+    if len(df) > LIMITE_LINHAS_XLSX:
+        raise ValueError(f"{len(df)} linhas excedem o limite do Excel ({LIMITE_LINHAS_XLSX}); use CSV ou Parquet.")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(planilha)
+    sheet.append([str(coluna) for coluna in df.columns])
+    for lote in _lotes(df, tamanho):
+        for linha in _linhas_planilha(lote):
+            sheet.append(linha)
+    workbook.save(path)
+
+
+EXPORTADORES = {"csv": exportar_csv, "parquet": exportar_parquet, "xlsx": exportar_xlsx}
+
+
+def exportar(df, path, formato, tamanho=LINHAS_POR_LOTE):
+    """Grava o DataFrame em `path` no formato informado (csv, parquet ou xlsx)."""
+    if formato not in EXPORTADORES:
+        raise ValueError(f"Formato de exportação desconhecido: {formato!r}")
+    EXPORTADORES[formato](df, path, tamanho)
+
+
+# --- Arquivos temporários das exportações da interface ---
+# Ficam em um diretório próprio do processo, removido ao encerrar; arquivos
+# de sessões abandonadas são apagados após EXPORTACAO_MAX_HORAS.
+EXPORTACAO_MAX_HORAS = float(os.environ.get("EXPORTACAO_MAX_HORAS", 1))
+_diretorio = None
+_lock_diretorio = threading.Lock()
+
+
+def diretorio_exportacao():
+    """Cria (uma vez por processo) o diretório temporário das exportações."""
+    global _diretorio
+    with _lock_diretorio:
+        if _diretorio is None:
+            _diretorio = tempfile.mkdtemp(prefix="siconfi-exportacao-")
+            atexit.register(shutil.rmtree, _diretorio, ignore_errors=True)
+    return _diretorio
+
+
+def novo_arquivo_exportacao(formato):
+    """Retorna o caminho de um novo arquivo vazio no diretório das exportações."""
+    descritor, path = tempfile.mkstemp(suffix=f".{formato}", dir=diretorio_exportacao())
+    os.close(descritor)
+    return path
+
+
+def remover_exportacao(path):
+    """Apaga o arquivo de uma exportação anterior, se ainda existir."""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def remover_exportacoes_antigas(max_horas=EXPORTACAO_MAX_HORAS):
+    """Apaga as exportações criadas há mais de `max_horas` e retorna quantas foram removidas."""
+    limite = time.time() - max_horas * 3600
+    removidos = 0
+    with os.scandir(diretorio_exportacao()) as entradas:
+        for entrada in entradas:
+            try:
+                if entrada.is_file() and entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+                    removidos += 1
+            except FileNotFoundError:
+                # Removido ao mesmo tempo por outra sessão
+                pass
+    return removidos
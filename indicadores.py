@@ -0,0 +1,300 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache_siconfi import ttl_para_exercicio
+from metricas import METRICAS
+
+COLUNA_PIB_PER_CAPITA = 'Produto Interno Bruto per capita, \na preços correntes\n(R$ 1,00)'
+
+# --- Especificação das contas extraídas dos anexos ---
+# Cada linha soma, por ente, os valores que atendem a todos os filtros preenchidos
+# (None = sem filtro). Uma variável com várias linhas soma todas elas.
+# `conta_contem` filtra as contas cujo nome contém o texto informado.
+COLUNA_RREO1_RECEITA = "Até o Bimestre (c)"
+COLUNA_RREO1_DESPESA = "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)"
+COLUNA_RREO2_DESPESA = "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)"
+COLUNA_RREO3_12_MESES = "TOTAL (ÚLTIMOS 12 MESES)"
+
+ESPEC_CONTAS = pd.DataFrame(
+    [
+        # variavel, anexo, cod_conta, coluna, conta, conta_contem
+        ("rec_rreo_1", "rreo_1", "TotalReceitas", COLUNA_RREO1_RECEITA, None, None),
+        ("iptu_rreo_3", "rreo_3", None, COLUNA_RREO3_12_MESES, None, "IPTU"),
+        ("iss_rreo_3", "rreo_3", None, COLUNA_RREO3_12_MESES, None, "ISS"),
+        ("div_ativa_trib_dca_ab", "dca_ab", "P1.1.2.5.0.00.00", None, None, None),
+        ("div_ativa_trib_dca_ab", "dca_ab", "P1.2.1.1.1.04.00", None, None, None),
+        ("despesa_total", "rreo_1", "TotalDespesas", COLUNA_RREO1_DESPESA, None, None),
+        ("despesa_investimentos", "rreo_1", "Investimentos", COLUNA_RREO1_DESPESA, None, None),
+        ("despesa_saude", "rreo_2", "RREO2TotalDespesas", COLUNA_RREO2_DESPESA, "Saúde", None),
+        ("despesa_educacao", "rreo_2", "RREO2TotalDespesas", COLUNA_RREO2_DESPESA, "Educação", None),
+        ("legislativo_rreo_2", "rreo_2", "RREO2TotalDespesas", COLUNA_RREO2_DESPESA, "Legislativa", None),
+        ("rec_trib_rreo_1", "rreo_1", "ReceitaTributaria", COLUNA_RREO1_RECEITA, None, None),
+        ("tranf_corr_rreo_1", "rreo_1", "TransferenciasCorrentes", COLUNA_RREO1_RECEITA, None, None),
+        ("at_circ", "dca_ab", "P1.1.0.0.0.00.00", None, None, None),
+        ("at_circ_disp", "dca_ab", "P1.1.1.0.0.00.00", None, None, None),
+        ("at_nao_circ", "dca_ab", "P1.2.0.0.0.00.00", None, None, None),
+        ("pass_circ", "dca_ab", "P2.1.0.0.0.00.00", None, None, None),
+        ("pass_nao_circ", "dca_ab", "P2.2.0.0.0.00.00", None, None, None),
+        ("vlr_restit", "dca_ab", "P2.1.8.8.0.00.00", None, None, None),
+        ("estoques", "dca_ab", "P1.1.5.0.0.00.00", None, None, None),
+        ("ativo", "dca_ab", "P1.0.0.0.0.00.00", None, None, None),
+        ("passivo", "dca_ab", "P2.1.0.0.0.00.00", None, None, None),
+        ("passivo", "dca_ab", "P2.2.0.0.0.00.00", None, None, None),
+        ("imobilizado", "dca_ab", "P1.2.3.0.0.00.00", None, None, None),
+        ("investimentos_ativo", "dca_ab", "P1.1.4.0.0.00.00", None, None, None),
+        ("pl", "dca_ab", "P2.3.0.0.0.00.00", None, None, None),
+        ("dps_corr_liq_rreo_1", "rreo_1", "DespesasCorrentes", COLUNA_RREO1_DESPESA, None, None),
+        ("rec_corre_rreo_1", "rreo_1", "ReceitasCorrentes", COLUNA_RREO1_RECEITA, None, None),
+        ("dps_capital_liq_rreo_1", "rreo_1", "DespesasDeCapital", COLUNA_RREO1_DESPESA, None, None),
+        ("rec_capital_rreo_1", "rreo_1", "ReceitasDeCapital", COLUNA_RREO1_RECEITA, None, None),
+        ("dps_pess_e_encarg_liq_rreo_1", "rreo_1", "PessoalEEncargosSociais", COLUNA_RREO1_DESPESA, None, None),
+        ("rcl", "rreo_3", "RREO3ReceitaCorrenteLiquida", COLUNA_RREO3_12_MESES, None, None),
+        ("rec_prevista", "rreo_1", "TotalReceitas", "PREVISÃO ATUALIZADA (a)", None, None),
+        ("desp_fixada", "rreo_1", "TotalDespesas", "DOTAÇÃO INICIAL (d)", None, None),
+        ("oper_cred", "rreo_1", "ReceitasDeOperacoesDeCredito", COLUNA_RREO1_RECEITA, None, None),
+        ("juros_e_encargos_div", "rreo_1", "JurosEEncargosDaDivida", COLUNA_RREO1_DESPESA, None, None),
+    ],
+    columns=["variavel", "anexo", "cod_conta", "coluna", "conta", "conta_contem"],
+)
+
+MOTIVO_SEM_DADOS = "sem dados de população ou PIB"
+
+CHAVES = ["ente", "anexo", "cod_conta", "coluna", "conta"]
+FILTROS = ["anexo", "cod_conta", "coluna", "conta"]
+
+
+def empilhar_anexos(anexos_por_ente):
+    """
+    Concatena os anexos de todos os entes em um único DataFrame longo
+    e soma os valores por (ente, anexo, cod_conta, coluna, conta).
+
+    Os DataFrames são concatenados uma única vez; ente e anexo são
+    acrescentados depois, repetidos conforme o tamanho de cada um.
+    """
+    partes, entes, anexos = [], [], []
+    for ente, anexos_ente in anexos_por_ente.items():
+        for anexo, df in anexos_ente.items():
+            if not df.empty:
+                partes.append(df)
+                entes.append(ente)
+                anexos.append(anexo)
+    if not partes:
+        return pd.DataFrame(columns=CHAVES + ["valor"])
+    tamanhos = [len(df) for df in partes]
+    dados = pd.concat(partes, ignore_index=True).reindex(columns=["cod_conta", "coluna", "conta", "valor"])
+    dados["ente"] = np.repeat(entes, tamanhos)
+    dados["anexo"] = np.repeat(anexos, tamanhos)
+    dados["valor"] = pd.to_numeric(dados["valor"], errors="coerce").fillna(0)
+    return dados.groupby(CHAVES, sort=False, dropna=False, observed=True)["valor"].sum().reset_index()
+
+
+def extrair_variaveis(dados, entes, espec=ESPEC_CONTAS):
+    """
+    Aplica a especificação de contas aos dados empilhados e retorna um
+    DataFrame (ente x variável) com as somas, preenchendo ausências com zero.
+    """
+    selecionados = []
+    # Filtros exatos: uma junção por combinação de campos preenchidos
+    exatos = espec[espec["conta_contem"].isna()]
+    preenchidos = exatos[FILTROS].notna()
+    for campos, grupo in exatos.groupby([preenchidos[campo] for campo in FILTROS]):
+        chaves = [campo for campo, usado in zip(FILTROS, campos) if usado]
+        selecionados.append(dados.merge(grupo[chaves + ["variavel"]], on=chaves)[["ente", "variavel", "valor"]])
+    # Filtros por trecho do nome da conta
+    for linha in espec[espec["conta_contem"].notna()].itertuples(index=False):
+        mascara = dados["conta"].str.contains(linha.conta_contem, na=False)
+        for campo in FILTROS:
+            if pd.notna(getattr(linha, campo)):
+                mascara &= dados[campo] == getattr(linha, campo)
+        selecionados.append(dados.loc[mascara, ["ente", "valor"]].assign(variavel=linha.variavel))
+
+    selecionados = pd.concat(selecionados, ignore_index=True)
+    variaveis = selecionados.pivot_table(
+        index="ente", columns="variavel", values="valor", aggfunc="sum", fill_value=0
+    ) if not selecionados.empty else pd.DataFrame()
+    return variaveis.reindex(index=pd.Index(entes, name="ente"), columns=espec["variavel"].unique(), fill_value=0)
+
+
+def _dividir(numerador, denominador):
+    """Divisão elemento a elemento que retorna 0 quando o denominador é 0."""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominador != 0, numerador / denominador, 0.0)
+
+
+def calcular_indicadores(v, nro_habitantes, pib_per_capita):
+    """Calcula os índices A1–H6 para todos os entes de uma só vez."""
+    hab = np.asarray(nro_habitantes, dtype=float)
+    return pd.DataFrame({
+        "A1_PIB per Capita": np.asarray(pib_per_capita, dtype=float),
+        "A2_Receita Total per Capita": _dividir(v.rec_rreo_1, hab),
+        "A3_IPTU per Capita": _dividir(v.iptu_rreo_3, hab),
+        "A4_ISS per Capita": _dividir(v.iss_rreo_3, hab),
+        "A5_Dívida Ativa per Capita": _dividir(v.div_ativa_trib_dca_ab, hab),
+        "B1_Despesas Orçamentárias per Capita": _dividir(v.despesa_total, hab),
+        "B2_Investimentos per Capita": _dividir(v.despesa_investimentos, hab),
+        "B3_Gastos com Saúde per Capita": _dividir(v.despesa_saude, hab),
+        "B4_Gastos com Educação per Capita": _dividir(v.despesa_educacao, hab),
+        "B5_Transferências para o Legislativo per Capita": _dividir(v.legislativo_rreo_2, hab),
+        "C1_Receita Tributária per Capita": _dividir(v.rec_trib_rreo_1, hab),
+        "C2_Receita de Transferências per Capita": _dividir(v.tranf_corr_rreo_1, hab),
+        "D1_Liquidez Instantânea ou Imediata": _dividir(v.at_circ_disp, v.pass_circ),
+        "D3_Liquidez com recursos de terceiros": _dividir(v.at_circ_disp, v.vlr_restit),
+        "D4_Liquidez Corrente": _dividir(v.at_circ, v.pass_circ),
+        "E2_Liquidez Seca": _dividir(v.at_circ - v.estoques, v.pass_circ),
+        "E3_Liquidez Geral": _dividir(v.at_circ + v.at_nao_circ, v.pass_circ + v.pass_nao_circ),
+        "E6_Solvência Geral": _dividir(v.ativo, v.pass_circ + v.pass_nao_circ),
+        "F1_Endividamento Geral": _dividir(v.passivo, v.ativo) * 100,
+        "F2_Composição das Exigibilidades": _dividir(v.pass_circ, v.passivo) * 100,
+        "F3_Imobilização do Patrimônio Líquido ou Capital Próprio": _dividir(v.imobilizado + v.investimentos_ativo, v.pl) * 100,
+        "F4_Grau de Comprometimento da Categoria Econômica Corrente": _dividir(v.dps_corr_liq_rreo_1, v.rec_corre_rreo_1) * 100,
+        "F5_Grau de Comprometimento da Categoria Econômica de Capital": _dividir(v.dps_capital_liq_rreo_1, v.rec_capital_rreo_1) * 100,
+        "G1_Grau de Gasto com Pessoal em relação a Despesa Orçamentária": _dividir(v.dps_pess_e_encarg_liq_rreo_1, v.dps_corr_liq_rreo_1) * 100,
+        "G2_Grau de Investimento em relação a Despesa Orçamentária": _dividir(v.despesa_investimentos, v.dps_corr_liq_rreo_1) * 100,
+        "G3_Grau de Gasto com Pessoal em relação a Receita corrente Líquida": _dividir(v.dps_pess_e_encarg_liq_rreo_1, v.rcl) * 100,
+        "G4_Grau de Receitas Correntes Próprias ": _dividir(v.rec_corre_rreo_1 - v.tranf_corr_rreo_1, v.rec_corre_rreo_1) * 100,
+        "H1_Grau de Execução Orçamentária da Receita": _dividir(v.rec_rreo_1, v.rec_prevista) * 100,
+        "H2_Grau de Execução Orçamentária da Despesa": _dividir(v.despesa_total, v.desp_fixada) * 100,
+        "H3_Grau do Resultado da Execução Orçamentária": _dividir(v.despesa_total, v.rec_rreo_1) * 100,
+        "H4_Grau de Autonomia Orçamentária": _dividir(v.rec_corre_rreo_1 - v.tranf_corr_rreo_1, v.despesa_total) * 100,
+        "H5_Grau de Amortização e refinanciamento de dívida": _dividir(v.oper_cred, v.despesa_total) * 100,
+        "H6_Grau de Encargos da dívida na despesa corrente": _dividir(v.juros_e_encargos_div, v.despesa_total) * 100,
+    }, index=v.index)
+
+
+def dados_socioeconomicos(entes, ano, df_ibge_data, populacao_data):
+    """Retorna (população, PIB per capita) de cada ente, com zero quando ausente."""
+    entes = pd.Index(entes, name="ente")
+    populacao = populacao_data.groupby("cod_ibge")["POPULAÇÃO"].sum()
+    nro_habitantes = populacao.reindex(entes, fill_value=0).fillna(0)
+    pib = df_ibge_data[df_ibge_data["Ano"] == ano].groupby("Código do Município")[COLUNA_PIB_PER_CAPITA].sum()
+    pib_per_capita = pib.reindex(entes, fill_value=0).fillna(0)
+    return nro_habitantes, pib_per_capita
+
+
+def calcular_indices(ano, anexos_por_ente, df_ibge_data, populacao_data):
+    """
+    Calcula os índices de todos os entes em uma única passada vetorizada.
+
+    Retorna o DataFrame de resultados (coluna "Município" com o código IBGE)
+    e a lista de entes descartados por falta de dados de população e PIB.
+    """
+    entes = list(anexos_por_ente)
+    if not entes:
+        return pd.DataFrame(), []
+    with METRICAS.medir("socioeconomicos"):
+        nro_habitantes, pib_per_capita = dados_socioeconomicos(entes, ano, df_ibge_data, populacao_data)
+    sem_dados = (nro_habitantes == 0) & (pib_per_capita == 0)
+    validos = sem_dados.index[~sem_dados]
+    with METRICAS.medir("empilhamento") as medida:
+        dados = empilhar_anexos(anexos_por_ente)
+        medida["linhas"] = len(dados)
+    with METRICAS.medir("extracao") as medida:
+        variaveis = extrair_variaveis(dados, validos)
+        medida["linhas"] = len(variaveis)
+    with METRICAS.medir("indicadores") as medida:
+        resultados = calcular_indicadores(variaveis, nro_habitantes[validos], pib_per_capita[validos])
+        medida["linhas"] = len(resultados)
+    return resultados.rename_axis("Município").reset_index(), list(sem_dados.index[sem_dados])
+
+
+# --- Cálculo progressivo para a interface ---
+LOTE_PROGRESSIVO = 200  # máximo de entes calculados de uma só vez
+INTERVALO_PROGRESSIVO = 1.0  # segundos máximos de espera para fechar um lote
+
+
+class MemoIndices:
+    """
+    Memoriza, no processo, o vetor de índices de cada par (ente, ano) para uma
+    versão dos dados de PIB/população (`versao`).
+
+    Só os entes ainda não calculados são buscados, todos em uma única passada;
+    entes sem dados de população/PIB também ficam memorizados (como None).
+    Falhas de acesso à API não são memorizadas. Vetores de exercícios ainda
+    abertos vencem após `ttl_para_exercicio(ano)`, como o cache de respostas.
+    """
+
+    def __init__(self):
+        self._vetores = {}
+        self._calculado_em = {}
+        self._colunas = []
+        self._lock = threading.Lock()
+
+    def _memorizado(self, ente, ano, versao):
+        """Indica se há vetor ainda válido para o ente; deve ser chamado com o lock."""
+        chave = (ente, ano, versao)
+        if chave not in self._vetores:
+            return False
+        ttl = ttl_para_exercicio(ano)
+        return ttl is None or time.time() - self._calculado_em[chave] < ttl
+
+    def calcular_progressivo(self, ano, entes, cliente, df_ibge_data, populacao_data, versao="",
+                             cancelar=None, ao_aguardar=None):
+        """
+        Gera (ente, vetor, motivo) para cada ente assim que ele fica pronto:
+        primeiro os já memorizados, depois os buscados no SICONFI, na ordem em
+        que chegam. `vetor` é uma Series com os índices, ou None quando o ente
+        não pôde ser calculado (e `motivo` diz por quê).
+
+        Os entes baixados são calculados em lotes: o lote é fechado ao atingir
+        LOTE_PROGRESSIVO entes ou quando INTERVALO_PROGRESSIVO segundos se
+        passaram desde o cálculo anterior. `cancelar` e `ao_aguardar` são
+        repassados a `ClienteSiconfi.buscar_anexos`.
+        """
+        faltantes = []
+        for ente in dict.fromkeys(entes):
+            with self._lock:
+                memorizado = self._memorizado(ente, ano, versao)
+            if memorizado:
+                yield (ente, *self._vetor(ente, ano, versao))
+            else:
+                faltantes.append(ente)
+
+        lote = {}
+        ultimo_calculo = time.monotonic()
+        buscas = cliente.buscar_anexos(ano, faltantes, cancelar=cancelar, ao_aguardar=ao_aguardar)
+        for ente, anexos, erro in buscas:
+            if erro is not None:
+                yield ente, None, erro
+                continue
+            lote[ente] = anexos
+            if len(lote) >= LOTE_PROGRESSIVO or time.monotonic() - ultimo_calculo >= INTERVALO_PROGRESSIVO:
+                yield from self._calcular_lote(ano, versao, lote, df_ibge_data, populacao_data)
+                lote = {}
+                ultimo_calculo = time.monotonic()
+        if lote:
+            yield from self._calcular_lote(ano, versao, lote, df_ibge_data, populacao_data)
+
+    def _calcular_lote(self, ano, versao, anexos_por_ente, df_ibge_data, populacao_data):
+        df_novos, sem_dados = calcular_indices(ano, anexos_por_ente, df_ibge_data, populacao_data)
+        self._memorizar(ano, versao, df_novos, sem_dados)
+        for ente in anexos_por_ente:
+            yield (ente, *self._vetor(ente, ano, versao))
+
+    def _memorizar(self, ano, versao, df_novos, sem_dados):
+        agora = time.time()
+        with self._lock:
+            for linha in df_novos.set_index("Município").itertuples():
+                self._vetores[(linha.Index, ano, versao)] = linha[1:]
+                self._calculado_em[(linha.Index, ano, versao)] = agora
+            for ente in sem_dados:
+                self._vetores[(ente, ano, versao)] = None
+                self._calculado_em[(ente, ano, versao)] = agora
+            if not df_novos.empty:
+                self._colunas = list(df_novos.columns[1:])
+
+    def _vetor(self, ente, ano, versao):
+        with self._lock:
+            vetor = self._vetores[(ente, ano, versao)]
+            if vetor is None:
+                return None, MOTIVO_SEM_DADOS
+            return pd.Series(vetor, index=self._colunas, name=ente), None
+
+    def limpar(self):
+        with self._lock:
+            self._vetores.clear()
+            self._calculado_em.clear()
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# --- Métricas por etapa do pipeline (busca -> extração -> tabela) ---
+# Cada registro é agregado pela chave (etapa, ente, anexo); ente e anexo
+# ficam vazios nas etapas que processam vários entes de uma vez.
+CAMPOS = ["chamadas", "segundos", "segundos_max", "bytes", "linhas", "tentativas", "erros", "cache_hits", "cache_misses"]
+
+DESCRICOES = {
+    "chamadas": "Número de execuções da etapa",
+    "segundos": "Tempo total gasto na etapa",
+    "segundos_max": "Maior tempo de uma única execução da etapa",
+    "bytes": "Bytes transferidos pela etapa",
+    "linhas": "Linhas produzidas pela etapa",
+    "tentativas": "Novas tentativas após falha",
+    "erros": "Execuções que terminaram em erro",
+    "cache_hits": "Respostas servidas pelo cache em disco",
+    "cache_misses": "Respostas ausentes do cache em disco",
+}
+
+
+class Metricas:
+    """Coletor de métricas de tempo, volume e cache, seguro para uso entre threads."""
+
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, etapa, ente=None, anexo=None, **valores):
+        """Soma os valores informados (ver CAMPOS) ao agregado de (etapa, ente, anexo)."""
+        chave = (etapa, ente or "", anexo or "")
+        with self._lock:
+            agregado = self._dados.setdefault(chave, dict.fromkeys(CAMPOS, 0))
+            for campo, valor in valores.items():
+                if campo == "segundos_max":
+                    agregado[campo] = max(agregado[campo], valor)
+                else:
+                    agregado[campo] += valor
+
+    @contextmanager
+    def medir(self, etapa, ente=None, anexo=None):
+        """
+        Mede o tempo de um bloco. O dicionário devolvido pode receber outros
+        campos (ex.: "bytes", "linhas") que serão registrados junto.
+        """
+        valores = {}
+        inicio = time.perf_counter()
+        try:
+            yield valores
+        except BaseException:
+            valores["erros"] = valores.get("erros", 0) + 1
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.registrar(etapa, ente, anexo, chamadas=1, segundos=segundos, segundos_max=segundos, **valores)
+
+    def detalhes(self):
+        """Retorna um DataFrame com uma linha por (etapa, ente, anexo)."""
+        with self._lock:
+            linhas = [{"etapa": e, "ente": n, "anexo": a, **v} for (e, n, a), v in self._dados.items()]
+        return pd.DataFrame(linhas, columns=["etapa", "ente", "anexo"] + CAMPOS)
+
+    def resumo(self, por=("etapa", "anexo")):
+        """Agrega os registros pelas colunas informadas."""
+        detalhes = self.detalhes()
+        somas = [campo for campo in CAMPOS if campo != "segundos_max"]
+        agregado = detalhes.groupby(list(por), sort=True).agg(
+            {**{campo: "sum" for campo in somas}, "segundos_max": "max"}
+        )
+        agregado["segundos_medio"] = agregado["segundos"] / agregado["chamadas"].where(agregado["chamadas"] > 0)
+        return agregado.reset_index()
+
+    def para_json(self):
+        """Exporta todos os registros (por etapa, ente e anexo) em JSON."""
+        return json.dumps(self.detalhes().to_dict(orient="records"), ensure_ascii=False, indent=2)
+
+    def para_prometheus(self, prefixo="siconfi_etapa"):
+        """Exporta os agregados por (etapa, anexo) no formato de texto do Prometheus."""
+        resumo = self.resumo()
+        linhas = []
+        for campo in CAMPOS:
+            tipo = "gauge" if campo == "segundos_max" else "counter"
+            nome = f"{prefixo}_{campo}" if tipo == "gauge" else f"{prefixo}_{campo}_total"
+            linhas.append(f"# HELP {nome} {DESCRICOES[campo]}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for registro in resumo.itertuples(index=False):
+                rotulos = f'etapa="{registro.etapa}"'
+                if registro.anexo:
+                    rotulos += f',anexo="{registro.anexo}"'
+                linhas.append(f"{nome}{{{rotulos}}} {getattr(registro, campo):g}")
+        return "\n".join(linhas) + "\n"
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+# Coletor padrão do processo
+METRICAS = Metricas()
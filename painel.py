@@ -0,0 +1,140 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache_siconfi import ttl_para_exercicio
+from indicadores import MOTIVO_SEM_DADOS, calcular_indices
+
+# --- Painel plurianual em formato longo: (Município, Ano, Índice, Valor) ---
+# O arquivo guarda também a versão da base do IBGE usada no cálculo (`versao`)
+# e o instante do cálculo (`calculado_em`); linhas de outra versão, ou de
+# exercício aberto com mais de `ttl_para_exercicio(ano)`, são recalculadas.
+PAINEL_PATH = os.environ.get("PAINEL_PATH", "data/cache/painel.parquet")
+COLUNAS = ["Município", "Ano", "Índice", "Valor"]
+CALCULADO_EM = "calculado_em"
+# Serializa as gravações do painel entre as sessões do processo
+_lock_gravacao = threading.Lock()
+
+
+def painel_vazio():
+    return pd.DataFrame({
+        "Município": pd.Series(dtype="int64"), "Ano": pd.Series(dtype="int64"),
+        "Índice": pd.Series(dtype="object"), "Valor": pd.Series(dtype="float64"),
+        CALCULADO_EM: pd.Series(dtype="float64"),
+    })
+
+
+def carregar_painel(path=PAINEL_PATH, versao=""):
+    """
+    Lê as linhas do painel calculadas com a `versao` da base do IBGE e ainda
+    dentro da validade do exercício, ou retorna um painel vazio.
+    """
+    if not (path and os.path.exists(path)):
+        return painel_vazio()
+    painel = pd.read_parquet(path)
+    if "versao" not in painel.columns:
+        return painel_vazio()
+    painel = painel[painel["versao"] == versao]
+    # Arquivos anteriores à coluna: células de exercício aberto ficam vencidas
+    calculado_em = painel[CALCULADO_EM] if CALCULADO_EM in painel.columns else pd.Series(0.0, index=painel.index)
+    ttl = painel["Ano"].map({ano: ttl_para_exercicio(ano) for ano in painel["Ano"].unique()}).astype(float)
+    vencidas = ttl.notna() & (time.time() - calculado_em >= ttl)
+    return painel.loc[~vencidas, COLUNAS].assign(**{CALCULADO_EM: calculado_em[~vencidas]}).reset_index(drop=True)
+
+
+def salvar_painel(painel, path=PAINEL_PATH, versao=""):
+    """Grava o painel de forma atômica (arquivo temporário exclusivo + rename)."""
+    diretorio = os.path.dirname(path) or "."
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    os.close(descritor)
+    try:
+        painel.assign(versao=versao).to_parquet(temporario, index=False)
+        os.replace(temporario, path)
+    except BaseException:
+        os.remove(temporario)
+        raise
+
+
+def celulas_faltantes(painel, entes, anos):
+    """Retorna os pares (Município, Ano) pedidos que ainda não estão no painel."""
+    pedidas = pd.MultiIndex.from_product([list(entes), list(anos)], names=["Município", "Ano"])
+    existentes = pd.MultiIndex.from_frame(painel[["Município", "Ano"]].drop_duplicates())
+    return pedidas.difference(existentes)
+
+
+def calcular_celulas(faltantes, df_ibge_data, populacao_data, cliente):
+    """
+    Busca e calcula apenas as células informadas, um ano por vez (todos os
+    entes do ano em uma passada). Retorna as novas linhas do painel e a lista
+    de (ente, ano, motivo) que não puderam ser calculadas.
+    """
+    partes = [painel_vazio()]
+    pendencias = []
+    agora = time.time()
+    for ano, entes in faltantes.to_frame(index=False).groupby("Ano")["Município"]:
+        anexos_por_ente = {}
+        for ente, anexos, erro in cliente.buscar_anexos(ano, entes.tolist()):
+            if erro is not None:
+                pendencias.append((ente, ano, erro))
+            else:
+                anexos_por_ente[ente] = anexos
+        df_resultados, sem_dados = calcular_indices(ano, anexos_por_ente, df_ibge_data, populacao_data)
+        pendencias.extend((ente, ano, MOTIVO_SEM_DADOS) for ente in sem_dados)
+        if not df_resultados.empty:
+            longo = df_resultados.melt(id_vars=["Município"], var_name="Índice", value_name="Valor")
+            partes.append(longo.assign(Ano=ano, **{CALCULADO_EM: agora})[COLUNAS + [CALCULADO_EM]])
+    return pd.concat(partes, ignore_index=True), pendencias
+
+
+def atualizar_painel(entes, anos, df_ibge_data, populacao_data, cliente, versao="", path=PAINEL_PATH):
+    """
+    Garante que o painel contenha todas as células (ente, ano) pedidas para a
+    `versao` da base do IBGE, calculando apenas as que faltam, e retorna o
+    recorte pedido.
+
+    Células sem dados não são gravadas e voltam a ser tentadas na próxima
+    chamada (os dados podem ser homologados depois); as de exercício aberto
+    são recalculadas após `ttl_para_exercicio(ano)`.
+    """
+    painel = carregar_painel(path, versao)
+    faltantes = celulas_faltantes(painel, entes, anos)
+    pendencias = []
+    if len(faltantes):
+        novos, pendencias = calcular_celulas(faltantes, df_ibge_data, populacao_data, cliente)
+        if not novos.empty:
+            painel = pd.concat([painel, novos], ignore_index=True)
+            if path:
+                with _lock_gravacao:
+                    # Relê o arquivo: outra sessão pode ter gravado células durante o cálculo
+                    gravado = pd.concat([carregar_painel(path, versao), novos], ignore_index=True)
+                    salvar_painel(gravado.drop_duplicates(COLUNAS[:3], keep="last"), path, versao)
+    recorte = painel[painel["Município"].isin(entes) & painel["Ano"].isin(anos)]
+    return recorte[COLUNAS].sort_values(COLUNAS[:3]).reset_index(drop=True), pendencias
+
+
+def adicionar_crescimento(painel):
+    """
+    Acrescenta, para cada (Município, Índice), a variação em relação ao ano
+    anterior disponível e a taxa composta (CAGR) desde o primeiro ano do painel.
+    A variação fica NaN quando a base é zero ou ausente; o CAGR só é definido
+    quando os valores inicial e final são ambos positivos (com os dois
+    negativos, a razão seria positiva mas a taxa não teria sentido).
+    """
+    painel = painel.sort_values(["Município", "Índice", "Ano"]).reset_index(drop=True)
+    grupos = painel.groupby(["Município", "Índice"], sort=False)
+    valor = painel["Valor"].to_numpy(dtype=float)
+    anterior = grupos["Valor"].shift().to_numpy(dtype=float)
+    primeiro = grupos["Valor"].transform("first").to_numpy(dtype=float)
+    anos = (painel["Ano"] - grupos["Ano"].transform("first")).to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variacao = np.where(anterior != 0, (valor - anterior) / np.abs(anterior) * 100, np.nan)
+        razao = valor / primeiro
+        cagr = np.where((anos > 0) & (primeiro > 0) & (valor > 0), (np.power(razao, 1 / anos) - 1) * 100, np.nan)
+
+    return painel.assign(**{"Variação Anual (%)": variacao, "CAGR (%)": cagr})
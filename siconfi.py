@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote, urlencode
+
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from metricas import METRICAS
+
+# --- Configurações da API do SICONFI ---
+BASE_URL = os.environ.get("SICONFI_BASE_URL", "https://apidatalake.tesouro.gov.br/ords/siconfi/tt")
+
+# Anexos utilizados no cálculo dos índices: nome interno -> (endpoint, parâmetros fixos)
+ANEXOS = {
+    "rreo_1": ("rreo", {"nr_periodo": 6, "co_tipo_demonstrativo": "RREO", "no_anexo": "RREO-Anexo 01"}),
+    "rreo_2": ("rreo", {"nr_periodo": 6, "co_tipo_demonstrativo": "RREO", "no_anexo": "RREO-Anexo 02"}),
+    "rreo_3": ("rreo", {"nr_periodo": 6, "co_tipo_demonstrativo": "RREO", "no_anexo": "RREO-Anexo 03"}),
+    "dca_ab": ("dca", {"no_anexo": "DCA-Anexo I-AB"}),
+}
+
+# Colunas mantidas de cada item retornado pela API, já com o tipo final. O ente
+# não é guardado por linha: cada resposta é de um único ente, o da consulta.
+ESQUEMA = pa.schema([
+    ("cod_conta", pa.string()),
+    ("coluna", pa.string()),
+    ("conta", pa.string()),
+    ("valor", pa.float64()),
+])
+
+# Valores padrão (podem ser sobrescritos por variáveis de ambiente)
+MAX_WORKERS = int(os.environ.get("SICONFI_MAX_WORKERS", 8))
+REQUISICOES_POR_SEGUNDO = float(os.environ.get("SICONFI_REQUISICOES_POR_SEGUNDO", 10))
+TIMEOUT = float(os.environ.get("SICONFI_TIMEOUT", 10))
+TENTATIVAS = int(os.environ.get("SICONFI_TENTATIVAS", 3))
+# Páginas buscadas simultaneamente quando o total de itens é conhecido
+PAGINAS_PARALELAS = int(os.environ.get("SICONFI_PAGINAS_PARALELAS", 4))
+# Intervalo (s) entre verificações do pedido de cancelamento durante a busca
+INTERVALO_CANCELAMENTO = 0.2
+# Modo offline: todas as respostas são servidas do cache em disco, sem acesso à rede
+OFFLINE = os.environ.get("SICONFI_OFFLINE", "0").lower() in ("1", "true", "sim")
+
+
+class RespostaIndisponivelOffline(LookupError):
+    """Resposta ausente do cache em disco quando o cliente está em modo offline."""
+
+
+class BuscaCancelada(Exception):
+    """A paginação foi interrompida pelo evento `cancelar`; nada é gravado no cache."""
+
+
+def _verificar_cancelamento(cancelar):
+    if cancelar is not None and cancelar.is_set():
+        raise BuscaCancelada()
+
+
+def erro_transitorio(erro):
+    """
+    Indica se vale a pena repetir a requisição: falhas de conexão, tempo
+    esgotado, HTTP 429 ou 5xx. Os demais 4xx se repetiriam da mesma forma.
+    """
+    if isinstance(erro, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                         requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(erro, requests.exceptions.HTTPError) and erro.response is not None:
+        return erro.response.status_code == 429 or erro.response.status_code >= 500
+    return False
+
+
+def periodo_do_anexo(anexo):
+    """Período usado como chave do cache (0 para anexos anuais, como os da DCA)."""
+    return ANEXOS[anexo][1].get("nr_periodo", 0)
+
+
+def montar_url(ano, anexo, ente):
+    """Monta a URL de consulta de um anexo para o ente e exercício informados."""
+    endpoint, params_fixos = ANEXOS[anexo]
+    params = {"an_exercicio": ano, **params_fixos, "id_ente": ente}
+    return f"{BASE_URL}/{endpoint}?{urlencode(params, quote_via=quote)}"
+
+
+def url_com_offset(url, offset, limite):
+    """Acrescenta os parâmetros de paginação do ORDS à URL."""
+    return f"{url}&offset={offset}&limit={limite}"
+
+
+def itens_para_tabela(itens):
+    """Converte os itens de uma página em tabela Arrow com apenas as colunas do ESQUEMA."""
+    return pa.Table.from_pylist(itens, schema=ESQUEMA)
+
+
+class LimitadorTaxa:
+    """Limita o número global de requisições por segundo entre todas as threads."""
+
+    def __init__(self, requisicoes_por_segundo):
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo > 0 else 0.0
+        self._proximo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(self._proximo, agora) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+class ClienteSiconfi:
+    """
+    Cliente da API do SICONFI com conexões reaproveitadas (keep-alive),
+    limite global de requisições por segundo e novas tentativas com backoff.
+    Se um `cache` for informado, as respostas são lidas e gravadas nele.
+    Tempos, bytes, linhas, novas tentativas e acertos de cache vão para `metricas`.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO,
+                 timeout=TIMEOUT, tentativas=TENTATIVAS, cache=None, offline=OFFLINE, metricas=METRICAS):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline
+        self.metricas = metricas
+        self.limitador = LimitadorTaxa(requisicoes_por_segundo)
+        self.session = requests.Session()
+        # Cada worker pode ter até PAGINAS_PARALELAS requisições em curso (ver `buscar_paginas`)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers * PAGINAS_PARALELAS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._get_json = retry(
+            retry=retry_if_exception(erro_transitorio),
+            stop=stop_after_attempt(tentativas),
+            wait=wait_exponential(multiplier=0.5, max=8),
+            before_sleep=self._registrar_tentativa,
+            reraise=True,
+        )(self._get_json)
+
+    def _registrar_tentativa(self, retry_state):
+        self.metricas.registrar("http", retry_state.kwargs.get("ente"), retry_state.kwargs.get("anexo"), tentativas=1)
+
+    def _get_json(self, url, ente=None, anexo=None):
+        self.limitador.aguardar()
+        with self.metricas.medir("http", ente, anexo) as medida:
+            resposta = self.session.get(url, verify=False, timeout=self.timeout)
+            medida["bytes"] = len(resposta.content)
+            resposta.raise_for_status()
+        with self.metricas.medir("json", ente, anexo):
+            return resposta.json()
+
+    def buscar_paginas(self, url, ente=None, anexo=None, cancelar=None):
+        """
+        Percorre a paginação do ORDS (`hasMore`, `limit`, `offset`, `links`) e gera
+        uma tabela Arrow por página. Se a resposta informar o total de itens
+        (`totalResults`), as páginas restantes são buscadas em paralelo.
+        Levanta `BuscaCancelada` se o evento `cancelar` for acionado entre páginas.
+        """
+        pagina = self._get_json(url, ente=ente, anexo=anexo)
+        yield itens_para_tabela(pagina["items"])
+        if not pagina.get("hasMore"):
+            return
+        limite = pagina.get("limit") or len(pagina["items"])
+        offset = pagina.get("offset", 0) + len(pagina["items"])
+        total = pagina.get("totalResults")
+
+        if total is not None:
+            urls = [url_com_offset(url, o, limite) for o in range(offset, total, limite)]
+            executor = ThreadPoolExecutor(max_workers=PAGINAS_PARALELAS)
+            try:
+                futuros = [executor.submit(self._get_json, u, ente=ente, anexo=anexo) for u in urls]
+                for futuro in futuros:
+                    while not futuro.done():
+                        _verificar_cancelamento(cancelar)
+                        wait([futuro], timeout=INTERVALO_CANCELAMENTO)
+                    yield itens_para_tabela(futuro.result()["items"])
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            return
+
+        while pagina.get("hasMore") and pagina["items"]:
+            _verificar_cancelamento(cancelar)
+            proxima = next((link["href"] for link in pagina.get("links", []) if link.get("rel") == "next"), None)
+            pagina = self._get_json(proxima or url_com_offset(url, offset, limite), ente=ente, anexo=anexo)
+            offset += len(pagina["items"])
+            yield itens_para_tabela(pagina["items"])
+
+    def buscar_tabela(self, ano, anexo, ente, renovar=False, cancelar=None):
+        """
+        Retorna um anexo como tabela Arrow, consultando primeiro o cache em disco.
+        Com `renovar`, a resposta é sempre buscada na API (e regravada no cache).
+        """
+        periodo = periodo_do_anexo(anexo)
+        with self.metricas.medir("busca", ente, anexo) as medida:
+            if self.cache is not None and not (renovar and not self.offline):
+                itens = self.cache.get(ano, anexo, periodo, ente, ignorar_validade=self.offline)
+                if itens is not None:
+                    tabela = itens_para_tabela(itens)
+                    medida.update(cache_hits=1, linhas=tabela.num_rows)
+                    return tabela
+                medida["cache_misses"] = 1
+            if self.offline:
+                raise RespostaIndisponivelOffline(f"{anexo} de {ente} ({ano}) não está no cache em disco")
+            tabela = pa.concat_tables(self.buscar_paginas(montar_url(ano, anexo, ente), ente, anexo, cancelar))
+            medida["linhas"] = tabela.num_rows
+        if self.cache is not None:
+            self.cache.put(ano, anexo, periodo, ente, tabela.to_pylist())
+        return tabela
+
+    def buscar_anexo(self, ano, anexo, ente, renovar=False, cancelar=None):
+        """Busca um único anexo (todas as páginas) e o retorna como DataFrame tipado."""
+        return self.buscar_tabela(ano, anexo, ente, renovar, cancelar).to_pandas()
+
+    def buscar_anexos(self, ano, entes, anexos=tuple(ANEXOS), cancelar=None, renovar=False, ao_aguardar=None):
+        """
+        Busca concorrentemente os anexos de todos os entes.
+
+        Gera tuplas (ente, {anexo: DataFrame}, erro) à medida que cada ente é
+        concluído; em caso de falha, o dicionário vem vazio e `erro` traz a exceção.
+        Se o evento `cancelar` for acionado (ou o gerador for fechado), as
+        requisições ainda não iniciadas são descartadas sem esperar as em curso,
+        inclusive as páginas restantes de anexos já iniciados.
+        `renovar` ignora o cache em disco na leitura (ver `buscar_tabela`).
+        `ao_aguardar` é chamado, na thread do consumidor, a cada
+        INTERVALO_CANCELAMENTO sem nenhuma requisição concluída; é onde a
+        interface pode reagir a uma interrupção (a exceção encerra a busca).
+        """
+        entes = list(entes)
+        pendentes = {ente: len(anexos) for ente in entes}
+        dados = {ente: {} for ente in entes}
+        erros = {}
+
+        # Acionado ao sair do gerador, por cancelamento ou fechamento, para
+        # interromper também a paginação dos anexos já em curso
+        interromper = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futuros = {
+            executor.submit(self.buscar_anexo, ano, anexo, ente, renovar, interromper): (ente, anexo)
+            for ente in entes for anexo in anexos
+        }
+        nao_concluidos = set(futuros)
+        try:
+            while nao_concluidos:
+                if cancelar is not None and cancelar.is_set():
+                    return
+                concluidos, nao_concluidos = wait(nao_concluidos, timeout=INTERVALO_CANCELAMENTO,
+                                                  return_when=FIRST_COMPLETED)
+                if not concluidos and ao_aguardar is not None:
+                    ao_aguardar()
+                for futuro in concluidos:
+                    ente, anexo = futuros[futuro]
+                    try:
+                        dados[ente][anexo] = futuro.result()
+                    except (requests.exceptions.RequestException, LookupError, ValueError, pa.ArrowException) as e:
+                        erros.setdefault(ente, e)
+                    pendentes[ente] -= 1
+                    if pendentes[ente] == 0:
+                        erro = erros.get(ente)
+                        yield ente, ({} if erro else dados.pop(ente)), erro
+        finally:
+            interromper.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from comparacao import comparar, grupos_de_pares
+
+
+@pytest.fixture
+def populacao():
+    return pd.DataFrame({
+        "UF": pd.array(["RJ", "RJ", None, "SP"], dtype="string"),
+        "NOME DO MUNICÍPIO": pd.array(["A", "B", "C", "D"], dtype="string"),
+        "POPULAÇÃO": [1_000.0, 2_000.0, 3_000.0, np.nan],
+        "cod_ibge": [1, 2, 3, 4],
+    })
+
+
+@pytest.mark.parametrize("criterio, sem_grupo", [("uf", 3), ("faixa", 4)])
+def test_grupo_ausente_fica_nan(populacao, criterio, sem_grupo):
+    grupos = grupos_de_pares(populacao, criterio)
+    assert grupos.isna().sum() == 1
+    assert pd.isna(grupos[sem_grupo])
+    assert not grupos.isin(["nan", "<NA>", "None"]).any()
+
+
+def test_comparar_usa_sem_grupo(populacao):
+    longo = pd.DataFrame({"Município": [1, 2, 3, 4], "Índice": "A1", "Valor": [1.0, 3.0, 5.0, 7.0]})
+    comparado = comparar(longo, grupos_de_pares(populacao, "uf")).set_index("Município")
+    assert comparado.loc[3, "Grupo"] == "Sem grupo"
+    assert comparado.loc[1, "Grupo"] == "RJ"
+    assert comparado.loc[1, "Média"] == 2.0
@@ -0,0 +1,120 @@
+"""
+Regressão da extração dirigida por ESPEC_CONTAS: os valores precisam ser os
+mesmos das consultas originais (`get_value_or_zero`), ente a ente.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import siconfi
+from benchmark.fixtures import carregar_fixtures
+from indicadores import ESPEC_CONTAS, empilhar_anexos, extrair_variaveis
+
+# Consultas da versão original de app.py: variavel -> (anexo, trecho da conta, query)
+CONSULTAS_ORIGINAIS = {
+    "rec_rreo_1": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "TotalReceitas"'),
+    "iptu_rreo_3": ("rreo_3", "IPTU", 'coluna == "TOTAL (ÚLTIMOS 12 MESES)"'),
+    "iss_rreo_3": ("rreo_3", "ISS", 'coluna == "TOTAL (ÚLTIMOS 12 MESES)"'),
+    "div_ativa_trib_dca_ab": ("dca_ab", None, 'cod_conta == "P1.1.2.5.0.00.00" or cod_conta == "P1.2.1.1.1.04.00"'),
+    "despesa_total": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "TotalDespesas"'),
+    "despesa_investimentos": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "Investimentos"'),
+    "despesa_saude": ("rreo_2", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Saúde" & cod_conta == "RREO2TotalDespesas"'),
+    "despesa_educacao": ("rreo_2", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Educação" & cod_conta == "RREO2TotalDespesas"'),
+    "legislativo_rreo_2": ("rreo_2", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (d)" & conta == "Legislativa" & cod_conta == "RREO2TotalDespesas"'),
+    "rec_trib_rreo_1": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitaTributaria"'),
+    "tranf_corr_rreo_1": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "TransferenciasCorrentes"'),
+    "at_circ": ("dca_ab", None, 'cod_conta == "P1.1.0.0.0.00.00"'),
+    "at_circ_disp": ("dca_ab", None, 'cod_conta == "P1.1.1.0.0.00.00"'),
+    "at_nao_circ": ("dca_ab", None, 'cod_conta == "P1.2.0.0.0.00.00"'),
+    "pass_circ": ("dca_ab", None, 'cod_conta == "P2.1.0.0.0.00.00"'),
+    "pass_nao_circ": ("dca_ab", None, 'cod_conta == "P2.2.0.0.0.00.00"'),
+    "vlr_restit": ("dca_ab", None, 'cod_conta == "P2.1.8.8.0.00.00"'),
+    "estoques": ("dca_ab", None, 'cod_conta == "P1.1.5.0.0.00.00"'),
+    "ativo": ("dca_ab", None, 'cod_conta == "P1.0.0.0.0.00.00"'),
+    "passivo": ("dca_ab", None, 'cod_conta == "P2.1.0.0.0.00.00" | cod_conta == "P2.2.0.0.0.00.00"'),
+    "imobilizado": ("dca_ab", None, 'cod_conta == "P1.2.3.0.0.00.00"'),
+    "investimentos_ativo": ("dca_ab", None, 'cod_conta == "P1.1.4.0.0.00.00"'),
+    "pl": ("dca_ab", None, 'cod_conta == "P2.3.0.0.0.00.00"'),
+    "dps_corr_liq_rreo_1": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "DespesasCorrentes"'),
+    "rec_corre_rreo_1": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasCorrentes"'),
+    "dps_capital_liq_rreo_1": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "DespesasDeCapital"'),
+    "rec_capital_rreo_1": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasDeCapital"'),
+    "dps_pess_e_encarg_liq_rreo_1": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "PessoalEEncargosSociais"'),
+    "rcl": ("rreo_3", None, 'cod_conta == "RREO3ReceitaCorrenteLiquida" and coluna == "TOTAL (ÚLTIMOS 12 MESES)"'),
+    "rec_prevista": ("rreo_1", None, 'coluna == "PREVISÃO ATUALIZADA (a)" & cod_conta == "TotalReceitas"'),
+    "desp_fixada": ("rreo_1", None, 'coluna == "DOTAÇÃO INICIAL (d)" & cod_conta == "TotalDespesas"'),
+    "oper_cred": ("rreo_1", None, 'coluna == "Até o Bimestre (c)" & cod_conta == "ReceitasDeOperacoesDeCredito"'),
+    "juros_e_encargos_div": ("rreo_1", None, 'coluna == "DESPESAS LIQUIDADAS ATÉ O BIMESTRE (h)" & cod_conta == "JurosEEncargosDaDivida"'),
+}
+
+
+def get_value_or_zero(df, query, column="valor"):
+    if df.empty:
+        return 0
+    filtered_df = df.query(query)
+    return filtered_df[column].sum() if not filtered_df.empty else 0
+
+
+def get_value_str_or_zero(df, string_contains, query, column="valor"):
+    if df.empty:
+        return 0
+    filtered_df = df[df["conta"].str.contains(string_contains, na=False)].query(query)
+    return filtered_df[column].sum() if not filtered_df.empty else 0
+
+
+def valores_originais(anexos):
+    valores = {}
+    for variavel, (anexo, trecho, consulta) in CONSULTAS_ORIGINAIS.items():
+        df = anexos.get(anexo, pd.DataFrame())
+        if trecho is None:
+            valores[variavel] = get_value_or_zero(df, consulta)
+        else:
+            valores[variavel] = get_value_str_or_zero(df, trecho, consulta)
+    return valores
+
+
+@pytest.fixture(scope="module")
+def anexos_por_ente():
+    modelos = {anexo: siconfi.itens_para_tabela(itens).to_pandas() for anexo, itens in carregar_fixtures().items()}
+    rng = np.random.default_rng(0)
+    anexos_por_ente = {}
+    for ente in range(9_000_000, 9_000_006):
+        anexos_por_ente[ente] = {
+            anexo: df.assign(valor=(df["valor"] * rng.uniform(0.5, 1.5, len(df))).round(2))
+            for anexo, df in modelos.items()
+        }
+    # Linhas repetidas devem ser somadas, como no `sum()` original
+    rreo_1 = anexos_por_ente[9_000_001]["rreo_1"]
+    anexos_por_ente[9_000_001]["rreo_1"] = pd.concat([rreo_1, rreo_1.head(50)], ignore_index=True)
+    # Anexo vazio e anexo ausente
+    anexos_por_ente[9_000_002]["rreo_2"] = modelos["rreo_2"].iloc[0:0]
+    del anexos_por_ente[9_000_003]["dca_ab"]
+    anexos_por_ente[9_000_004] = {}
+    return anexos_por_ente
+
+
+def test_especificacao_cobre_as_consultas_originais():
+    assert set(ESPEC_CONTAS["variavel"]) == set(CONSULTAS_ORIGINAIS)
+
+
+def test_extracao_igual_as_consultas_originais(anexos_por_ente):
+    entes = list(anexos_por_ente)
+    variaveis = extrair_variaveis(empilhar_anexos(anexos_por_ente), entes)
+    esperado = pd.DataFrame(
+        [valores_originais(anexos_por_ente[ente]) for ente in entes],
+        index=pd.Index(entes, name="ente"),
+    )[variaveis.columns]
+    pd.testing.assert_frame_equal(variaveis.astype(float), esperado.astype(float), check_names=False, check_exact=False, rtol=1e-9)
+
+
+def test_extracao_encontra_valores(anexos_por_ente):
+    variaveis = extrair_variaveis(empilhar_anexos(anexos_por_ente), list(anexos_por_ente))
+    # O ente modelo tem todas as contas; o teste acima não pode passar só com zeros
+    assert (variaveis.loc[9_000_000] != 0).all()
+    assert (variaveis.loc[9_000_004] == 0).all()
+
+
+def test_empilhar_anexos_vazio():
+    dados = empilhar_anexos({1: {}, 2: {"rreo_1": pd.DataFrame()}})
+    assert dados.empty
+    assert list(dados.columns) == ["ente", "anexo", "cod_conta", "coluna", "conta", "valor"]
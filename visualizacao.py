@@ -0,0 +1,72 @@
+import math
+
+import pandas as pd
+
+# --- Visualização paginada do resultado em formato longo ---
+# Filtros, ordenação e paginação são feitos no servidor; só a página visível
+# é formatada e enviada ao navegador.
+LINHAS_POR_PAGINA = 50
+CATEGORIAS = list("ABCDEFGH")
+
+COLUNAS_VISUALIZACAO = [
+    "Município", "UF", "Categoria", "Índice", "Valor", "Média", "Mediana",
+    "Percentil", "Z-score", "Variação (%)", "Classificação",
+]
+FORMATOS = {
+    "Valor": "{:.2f}", "Média": "{:.2f}", "Mediana": "{:.2f}", "Percentil": "{:.0f}",
+    "Z-score": "{:.2f}", "Variação (%)": "{:.2f}", "Classificação": "{:.0f}",
+}
+
+
+def preparar(comparado, populacao, nomes=None):
+    """
+    Acrescenta ao resultado de `comparacao.comparar` a UF do município e a
+    categoria do índice (a letra inicial, de A a H), e troca os códigos IBGE
+    pelos nomes informados em `nomes`.
+    """
+    uf = populacao.drop_duplicates("cod_ibge").set_index("cod_ibge")["UF"]
+    df = comparado.assign(
+        UF=comparado["Município"].map(uf).astype("category"),
+        Categoria=comparado["Índice"].str[0].astype("category"),
+    )
+    if nomes:
+        df["Município"] = df["Município"].map(lambda ente: nomes.get(ente, ente)).astype(str)
+    colunas = [coluna for coluna in COLUNAS_VISUALIZACAO if coluna in df.columns]
+    extras = [coluna for coluna in df.columns if coluna not in colunas]
+    return df[colunas + extras].reset_index(drop=True)
+
+
+def filtrar(df, categorias=None, ufs=None, classificacoes=None):
+    """Aplica os filtros informados (None ou vazio = sem filtro)."""
+    mascara = pd.Series(True, index=df.index)
+    if categorias:
+        mascara &= df["Categoria"].isin(categorias)
+    if ufs:
+        mascara &= df["UF"].isin(ufs)
+    if classificacoes:
+        mascara &= df["Classificação"].isin(classificacoes)
+    return df[mascara]
+
+
+def ordenar(df, coluna=None, crescente=True):
+    """Ordena pela coluna informada, com valores ausentes sempre no fim."""
+    if not coluna:
+        return df
+    return df.sort_values(coluna, ascending=crescente, na_position="last", kind="stable")
+
+
+def total_paginas(df, tamanho=LINHAS_POR_PAGINA):
+    return max(1, math.ceil(len(df) / tamanho))
+
+
+def pagina(df, numero, tamanho=LINHAS_POR_PAGINA):
+    """Retorna as linhas da página `numero` (a partir de 1)."""
+    numero = min(max(1, numero), total_paginas(df, tamanho))
+    inicio = (numero - 1) * tamanho
+    return df.iloc[inicio:inicio + tamanho]
+
+
+def formatar_pagina(df_pagina):
+    """Formata apenas as linhas da página visível."""
+    formatos = {coluna: formato for coluna, formato in FORMATOS.items() if coluna in df_pagina.columns}
+    return df_pagina.style.format(formatos, na_rep="-")